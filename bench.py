@@ -0,0 +1,298 @@
+# Benchmark suite for TuiTrivia
+#
+# Runs the game headless against a stub trivia API and a local leaderboard
+# server in a scratch directory, and saves the results to bench_results/
+# as JSON.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from stubs import OpenTDBStub, start_leaderboard, start_stub
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(REPO_DIR, "bench_results")
+USERNAME = "bench"
+PASSWORD = "bench"
+# Most time importing main may take, measured inside a fresh interpreter so
+# interpreter startup itself isn't counted
+IMPORT_TIME_BUDGET_MS = 50
+# Imports timed for the budget check, their median is compared to it
+IMPORT_RUNS = 15
+IMPORT_TIMER = (
+    "import time; start = time.perf_counter(); import main; "
+    "print(time.perf_counter() - start)"
+)
+# Thin client session on a running daemon, passwords are read as plain lines
+DAEMON_CLIENT = "import daemon, sys; daemon.connect(sys.argv[1], input)"
+DAEMON_SOCKET = "tuitrivia.sock"
+
+
+# Function to get the p-th percentile of a list of numbers
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Function to summarize a list of durations in milliseconds
+def summarize(durations):
+    return {
+        "count": len(durations),
+        "total_ms": sum(durations) * 1000,
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p95_ms": percentile(durations, 95) * 1000,
+        "max_ms": max(durations) * 1000,
+    }
+
+
+# Function to run one scripted session in this process, returns seconds taken
+def run_session(main, lines):
+    path = os.path.join(os.getcwd(), "session.txt")
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.run_script(path)
+    return time.perf_counter() - start
+
+
+def login():
+    return ["1", USERNAME, PASSWORD]
+
+
+def bench_startup(opentdb_url, api_url, runs, import_runs):
+    script = os.path.join(os.getcwd(), "startup.txt")
+    with open(script, "w") as file:
+        file.write("\n".join(login() + ["exit"]) + "\n")
+    command = [
+        sys.executable,
+        os.path.join(REPO_DIR, "main.py"),
+        "--script",
+        script,
+        "--api-url",
+        api_url,
+        "--opentdb-url",
+        opentdb_url,
+    ]
+    imports = []
+    main_imports = []
+    # The first import warms the disk cache and writes bytecode, it is not
+    # counted so the budget check measures the code and not the cache
+    for run in range(import_runs + 1):
+        start = time.perf_counter()
+        timer = subprocess.run(
+            [sys.executable, "-c", IMPORT_TIMER],
+            cwd=os.getcwd(),
+            env={**os.environ, "PYTHONPATH": REPO_DIR},
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        if run:
+            imports.append(time.perf_counter() - start)
+            main_imports.append(float(timer.stdout))
+    sessions = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        sessions.append(time.perf_counter() - start)
+    return {
+        "import": summarize(imports),
+        "import_main": summarize(main_imports),
+        "login_and_exit": summarize(sessions),
+        "daemon_login_and_exit": bench_daemon(script, opentdb_url, api_url, runs),
+    }
+
+
+# Function to time scripted sessions on a daemon, which has already loaded
+# everything once
+def bench_daemon(script, opentdb_url, api_url, runs):
+    daemon = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(REPO_DIR, "main.py"),
+            "--daemon",
+            "--api-url",
+            api_url,
+            "--opentdb-url",
+            opentdb_url,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.perf_counter() + 10
+        while not os.path.exists(DAEMON_SOCKET):
+            if time.perf_counter() > deadline or daemon.poll() is not None:
+                raise RuntimeError("The daemon did not start")
+            time.sleep(0.01)
+        sessions = []
+        for _ in range(runs):
+            with open(script, "r") as stdin:
+                start = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, "-c", DAEMON_CLIENT, DAEMON_SOCKET],
+                    stdin=stdin,
+                    stdout=subprocess.DEVNULL,
+                    env={**os.environ, "PYTHONPATH": REPO_DIR},
+                    check=True,
+                )
+                sessions.append(time.perf_counter() - start)
+        return summarize(sessions)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def bench_questions(main, count):
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        question = main.get_random_question()
+        durations.append(time.perf_counter() - start)
+        assert question, "the stub API did not return a question"
+    return summarize(durations)
+
+
+def bench_score_writes(main, count, users):
+    start = time.perf_counter()
+    for i in range(count):
+        main.update_score(f"player{i % users}", 10)
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    main.score_outbox.flush()
+    flushed = time.perf_counter() - start
+    return {
+        "writes": count,
+        "writes_per_second": count / elapsed,
+        "outbox_flush_ms": flushed * 1000,
+    }
+
+
+# Leaderboard render time is a session running the command minus a session
+# that only logs in and exits
+def bench_leaderboards(main, users, board):
+    scores = {f"user{i}": {"score": i, "date": "2025-01-01 00:00:00"} for i in range(users)}
+    with open(main.SCORES_FILE, "w") as file:
+        json.dump(scores, file)
+    for username, data in scores.items():
+        board.set(username, data["score"], data["date"])
+    baseline = min(run_session(main, login() + ["exit"]) for _ in range(3))
+    local = run_session(main, login() + ["scores local", "exit"]) - baseline
+    main.leaderboard_cache.clear()
+    remote = run_session(main, login() + ["scores global", "exit"]) - baseline
+    main.leaderboard_cache.clear()
+    remote_all = run_session(main, login() + [f"scores global {users}", "exit"]) - baseline
+    return {
+        "users": users,
+        "local_ms": local * 1000,
+        "global_ms": remote * 1000,
+        "global_all_ms": remote_all * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TuiTrivia benchmark suite")
+    parser.add_argument(
+        "--questions", type=int, default=50, help="length of the trivia streak"
+    )
+    parser.add_argument("--score-writes", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100000, help="leaderboard size")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument(
+        "--import-runs",
+        type=int,
+        default=IMPORT_RUNS,
+        help="imports of main timed for the budget check",
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=IMPORT_TIME_BUDGET_MS,
+        help="fail if importing main takes longer than this many milliseconds (p50)",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds added to every stub response"
+    )
+    parser.add_argument(
+        "--output", help="results file (default: bench_results/<timestamp>.json)"
+    )
+    args = parser.parse_args()
+
+    _, opentdb_url = start_stub(OpenTDBStub, args.latency)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        leaderboard, api_url = start_leaderboard(
+            os.path.join(scratch, "leaderboard.json"), args.latency
+        )
+        sys.path.insert(0, REPO_DIR)
+        import main as game
+
+        game.API_URL = api_url
+        game.OPENTDB_URL = opentdb_url
+        game.question_buffer.request_interval = 0
+        run_session(game, ["2", USERNAME, PASSWORD, "exit"])
+
+        results = {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "stub_latency": args.latency,
+            "startup": bench_startup(
+                opentdb_url, api_url, args.startup_runs, args.import_runs
+            ),
+            "questions": bench_questions(game, args.questions),
+            "score_writes": bench_score_writes(game, args.score_writes, 100),
+            "leaderboard": bench_leaderboards(game, args.users, leaderboard.board),
+        }
+        os.chdir(REPO_DIR)
+    import_ms = results["startup"]["import_main"]["p50_ms"]
+    results["import_budget"] = {
+        "budget_ms": args.import_budget,
+        "p50_ms": import_ms,
+        "within_budget": import_ms <= args.import_budget,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+        output = os.path.join(RESULTS_DIR, name)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=4)
+
+    startup = results["startup"]
+    print(
+        f"Import: {startup['import']['p50_ms']:.1f}ms with interpreter startup, "
+        f"{import_ms:.1f}ms for main (budget {args.import_budget:.0f}ms)"
+    )
+    print(
+        f"Login and exit: {startup['login_and_exit']['p50_ms']:.1f}ms, "
+        f"{startup['daemon_login_and_exit']['p50_ms']:.1f}ms on a running daemon"
+    )
+    questions = results["questions"]
+    print(
+        f"{questions['count']} questions: {questions['total_ms']:.1f}ms total, "
+        f"p50 {questions['p50_ms']:.2f}ms, p95 {questions['p95_ms']:.2f}ms"
+    )
+    writes = results["score_writes"]
+    print(f"Score writes: {writes['writes_per_second']:.0f}/sec")
+    board = results["leaderboard"]
+    print(
+        f"Leaderboard with {board['users']} users: local {board['local_ms']:.1f}ms, "
+        f"global {board['global_ms']:.1f}ms (all rows {board['global_all_ms']:.1f}ms)"
+    )
+    print(f"Results saved to {output}")
+    if not results["import_budget"]["within_budget"]:
+        print(f"Importing main is over its {args.import_budget:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
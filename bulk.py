@@ -0,0 +1,154 @@
+# Bulk leaderboard operations for TuiTrivia admins
+
+import csv
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from jsonstream import iter_array
+
+EDIT_FIELDS = ("old_username", "new_username", "new_score", "new_date")
+SCORE_FIELDS = ("username", "score", "date")
+INTEGER_FIELDS = ("new_score", "score")
+READ_SIZE = 65536
+
+
+# Raised by a batch sender when the server has no batch endpoint
+class BatchUnsupported(Exception):
+    pass
+
+
+class BulkResult:
+    def __init__(self):
+        self.sent = 0
+        # (row number, reason) for every row that failed
+        self.failures = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def fail(self, row, reason):
+        self.failures.append((row, reason))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+# Function to read rows from a CSV file with a header row, or a JSON array
+# of objects. Yields (row number, row) pairs, where row is the dict of the
+# given fields or a string saying why the row is invalid. The file is read
+# as it is used, so boards of any size can be imported
+def read_rows(path, fields):
+    if path.endswith(".csv"):
+        with open(path, "r", newline="") as file:
+            for number, row in enumerate(csv.DictReader(file), 1):
+                yield number, validate(row, fields)
+    else:
+        with open(path, "rb") as file:
+            chunks = iter(lambda: file.read(READ_SIZE), b"")
+            for number, row in enumerate(iter_array(chunks), 1):
+                if not isinstance(row, dict):
+                    yield number, "Not an object"
+                else:
+                    yield number, validate(row, fields)
+
+
+def validate(row, fields):
+    missing = [field for field in fields if row.get(field) in (None, "")]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    row = {field: row[field] for field in fields}
+    for field in INTEGER_FIELDS:
+        if field in row:
+            try:
+                row[field] = int(row[field])
+            except (TypeError, ValueError):
+                return f"Invalid {field}"
+    return row
+
+
+# Function to write rows to a CSV file, or a JSON array for any other
+# extension, one row at a time. Returns the number of rows written
+def write_rows(path, rows, fields):
+    count = 0
+    with open(path, "w", newline="") as file:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(file, fields, extrasaction="ignore")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            file.write("[")
+            for row in rows:
+                file.write(",\n" if count else "\n")
+                file.write(json.dumps({field: row.get(field) for field in fields}))
+                count += 1
+            file.write("\n]\n")
+    return count
+
+
+# Function to send rows one request each, with at most `workers` requests
+# in flight. send(row) returns None on success or the reason it failed
+def send_concurrently(rows, send, workers):
+    result = BulkResult()
+    pending = {}
+    with ThreadPoolExecutor(workers) as executor:
+
+        def collect(done):
+            for future in done:
+                number = pending.pop(future)
+                try:
+                    reason = future.result()
+                except Exception as e:
+                    reason = str(e)
+                if reason:
+                    result.fail(number, reason)
+                else:
+                    result.sent += 1
+
+        for number, row in rows:
+            if isinstance(row, str):
+                result.fail(number, row)
+                continue
+            # Only read more rows once a request finishes
+            if len(pending) >= workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(send, row)] = number
+        collect(wait(pending).done)
+    return result.finish()
+
+
+# Function to send rows in batches of `size` to a batch endpoint.
+# send_batch(rows) returns one reason or None per row, and raises
+# BatchUnsupported if the server has no batch endpoint, which is only
+# possible on the first batch
+def send_batches(rows, send_batch, size):
+    result = BulkResult()
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        valid = []
+        for number, row in batch:
+            if isinstance(row, str):
+                result.fail(number, row)
+            else:
+                valid.append((number, row))
+        if not valid:
+            continue
+        try:
+            reasons = send_batch([row for _, row in valid])
+        except BatchUnsupported:
+            raise
+        except Exception as e:
+            reasons = [str(e)] * len(valid)
+        for (number, _), reason in zip(valid, reasons):
+            if reason:
+                result.fail(number, reason)
+            else:
+                result.sent += 1
+    return result.finish()
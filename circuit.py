@@ -0,0 +1,80 @@
+# Circuit breaker for TuiTrivia's remote services
+
+import threading
+
+FAILURE_THRESHOLD = 3
+PROBE_INTERVAL = 15
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+# After failure_threshold failures in a row the circuit opens and callers
+# are told not to use the service, so they can fall back right away instead
+# of waiting on timeouts. While it is open a background thread probes the
+# service every probe_interval seconds (half-open), and closes the circuit
+# as soon as a probe succeeds
+class CircuitBreaker:
+    def __init__(self, probe, failure_threshold=FAILURE_THRESHOLD, probe_interval=PROBE_INTERVAL):
+        # probe() returns True if the service is healthy. It is only ever
+        # called from the probe thread
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # True if the service should be called
+    def allow(self):
+        with self.lock:
+            return self.state == CLOSED
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = CLOSED
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state != CLOSED or self.failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._probe_until_closed, daemon=True)
+                self.thread.start()
+
+    # Close the circuit without waiting for a probe, e.g. after switching
+    # to another server
+    def reset(self):
+        self.success()
+
+    def stop(self):
+        self.stopped.set()
+
+    # Every exit happens under the lock together with clearing self.thread,
+    # so a failure racing with the exit always gets a new probe thread
+    def _probe_until_closed(self):
+        while True:
+            self.stopped.wait(self.probe_interval)
+            with self.lock:
+                if self.state == CLOSED or self.stopped.is_set():
+                    self.thread = None
+                    return
+                self.state = HALF_OPEN
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            with self.lock:
+                # Otherwise a reset closed the circuit while probing
+                if self.state == HALF_OPEN:
+                    if healthy:
+                        self.failures = 0
+                        self.state = CLOSED
+                    else:
+                        self.state = OPEN
@@ -0,0 +1,258 @@
+# Background daemon for TuiTrivia
+#
+# The daemon keeps one warm copy of the game: its imported modules, question
+# buffers, leaderboard cache, pooled HTTP connections and loaded stores.
+# main.py connects to it over a Unix domain socket and becomes a thin
+# client, so a session is ready as soon as it connects, and every terminal
+# on the host shares the same caches. Each session runs the game's own
+# login and REPL on a thread of the daemon, with its output, input, screen
+# and session state (settings, API key, seen questions) redirected to the
+# client's own.
+#
+# Messages are newline-delimited JSON:
+#   client -> daemon: hello {tty, columns, lines}, input {text, columns, lines}, eof
+#   daemon -> client: output {text}, input {prompt, hidden, timeout}, exit
+# An input request with a timeout is answered with a null text if the
+# player runs out of time. The client keeps the deadline, so network delay
+# doesn't eat into the player's time
+
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from contextvars import ContextVar
+
+from input_loop import read_line
+from render import Screen
+
+current_session = ContextVar("current_session", default=None)
+
+
+class Session:
+    def __init__(self, rfile, wfile, hello, state):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.tty = bool(hello.get("tty"))
+        self.columns = hello.get("columns", 80)
+        self.lines = hello.get("lines", 24)
+        self.lock = threading.Lock()
+        self.stdout = SessionOutput(self)
+        self.stdin = SessionInput(self)
+        self.screen = SessionScreen(self)
+        self.state = state
+
+    def send(self, message):
+        with self.lock:
+            self.wfile.write((json.dumps(message) + "\n").encode())
+            self.wfile.flush()
+
+    # Ask the client for a line, raises EOFError once it has no more input.
+    # With a timeout, returns None if no line was entered in time
+    def input(self, prompt="", hidden=False, timeout=None):
+        self.send({"type": "input", "prompt": prompt, "hidden": hidden, "timeout": timeout})
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError()
+        message = json.loads(line)
+        if message.get("type") != "input":
+            raise EOFError()
+        # The terminal may have been resized since the last answer
+        self.columns = message.get("columns", self.columns)
+        self.lines = message.get("lines", self.lines)
+        return message["text"]
+
+
+# sys.stdout of a session, every write is sent to the client as it is, so
+# a frame drawn with one write arrives in one piece
+class SessionOutput:
+    encoding = "utf-8"
+
+    def __init__(self, session):
+        self.session = session
+
+    def write(self, text):
+        if text:
+            self.session.send({"type": "output", "text": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.session.tty
+
+
+# sys.stdin of a session. It has no file descriptor, so input() and the
+# multiplayer client read it line by line
+class SessionInput:
+    encoding = "utf-8"
+
+    def __init__(self, session):
+        self.session = session
+
+    def readline(self):
+        try:
+            return self.session.input() + "\n"
+        except EOFError:
+            return ""
+
+    # Used by input_loop.read_line for timed prompts
+    def read_line(self, prompt, timeout):
+        return self.session.input(prompt, timeout=timeout)
+
+    def isatty(self):
+        return False
+
+
+# The client's terminal, not the daemon's, decides the frame size
+class SessionScreen(Screen):
+    def __init__(self, session):
+        super().__init__(session.stdout, session.tty)
+        self.session = session
+
+    def size(self):
+        return os.terminal_size((self.session.columns, self.session.lines))
+
+
+# Stands in for a process-wide object, like sys.stdout or the game's
+# screen: inside a session it forwards to the session's own one, anywhere
+# else (e.g. background threads) to the original
+class SessionLocal:
+    def __init__(self, name, default):
+        self._name = name
+        self._default = default
+
+    def _target(self):
+        session = current_session.get()
+        return getattr(session, self._name) if session else self._default
+
+    def __getattr__(self, attribute):
+        return getattr(self._target(), attribute)
+
+    def __setattr__(self, attribute, value):
+        if attribute.startswith("_"):
+            super().__setattr__(attribute, value)
+        else:
+            setattr(self._target(), attribute, value)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        game = self.server.game
+        line = self.rfile.readline()
+        if not line:
+            return
+        session = Session(self.rfile, self.wfile, json.loads(line), game.SessionState())
+        current_session.set(session)
+        try:
+            username = game.login()
+            # Sessions of the same player share their seen-question history
+            with self.server.lock:
+                sampler = self.server.samplers.get(username)
+                if sampler is None:
+                    sampler = self.server.samplers[username] = game.new_sampler(username)
+            session.state.sampler = sampler
+            game.repl(username)
+            game.flush_scores()
+            session.send({"type": "exit"})
+        except (EOFError, OSError):
+            pass
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, game):
+        super().__init__(path, Handler)
+        self.game = game
+        self.samplers = {}
+        self.lock = threading.Lock()
+
+
+# Function to check whether a daemon is listening on a socket
+def running(path):
+    with socket.socket(socket.AF_UNIX) as client:
+        try:
+            client.connect(path)
+        except OSError:
+            return False
+        return True
+
+
+# Function to run the daemon until it is interrupted or terminated. game is
+# the main module, so sessions share the state it has already loaded
+def serve(game, path):
+    if os.path.exists(path):
+        if running(path):
+            raise OSError(f"A daemon is already listening on {path}")
+        # Left behind by a daemon that did not exit cleanly
+        os.unlink(path)
+    server = DaemonServer(path, game)
+    print(f"Serving sessions on {path}", flush=True)
+    sys.stdout = SessionLocal("stdout", sys.stdout)
+    sys.stdin = SessionLocal("stdin", sys.stdin)
+    game.screen = SessionLocal("screen", game.screen)
+    game.state = SessionLocal("state", game.state)
+    read_password = game.read_password
+
+    def read_session_password(prompt):
+        session = current_session.get()
+        if session is None:
+            return read_password(prompt)
+        return session.input(prompt, hidden=True)
+
+    game.read_password = read_session_password
+    game.score_outbox.start()
+    # Terminating the daemon stops it cleanly, like Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+        sys.stdout = sys.__stdout__
+        sys.stdin = sys.__stdin__
+        game.shutdown()
+
+
+# Function to play a session on a running daemon. Returns False if no
+# daemon is listening, otherwise True once the session is over
+def connect(path, read_hidden):
+    client = socket.socket(socket.AF_UNIX)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return False
+    with client, client.makefile("rb") as reader, client.makefile("wb") as writer:
+
+        def send(message):
+            size = shutil.get_terminal_size()
+            message = {**message, "columns": size.columns, "lines": size.lines}
+            writer.write((json.dumps(message) + "\n").encode())
+            writer.flush()
+
+        send({"type": "hello", "tty": sys.stdout.isatty()})
+        for line in reader:
+            message = json.loads(line)
+            match message["type"]:
+                case "output":
+                    sys.stdout.write(message["text"])
+                    sys.stdout.flush()
+                case "input":
+                    try:
+                        if message["hidden"]:
+                            text = read_hidden(message["prompt"])
+                        else:
+                            text = read_line(message["prompt"], message.get("timeout"))
+                    except EOFError:
+                        send({"type": "eof"})
+                        continue
+                    send({"type": "input", "text": text})
+                case "exit":
+                    break
+    return True
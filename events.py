@@ -0,0 +1,220 @@
+# Answer event log for TuiTrivia
+
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from struct import Struct
+
+from file_lock import locked
+
+# One fixed-width record per answer: time, question hash prefix, user and
+# category name ids, response seconds, difficulty, mode, correct, padding
+RECORD = Struct("<dQIIfBBB5x")
+DIFFICULTIES = ("", "easy", "medium", "hard")
+MODES = ("trivia", "custom", "multiplayer", "online")
+PERCENTILES = (50, 90, 99)
+
+
+# numpy dtype matching RECORD, so the log can be memory-mapped as columns
+def record_dtype(numpy):
+    dtype = numpy.dtype(
+        [
+            ("time", "<f8"),
+            ("question", "<u8"),
+            ("user", "<u4"),
+            ("category", "<u4"),
+            ("seconds", "<f4"),
+            ("difficulty", "u1"),
+            ("mode", "u1"),
+            ("correct", "u1"),
+            ("padding", "V5"),
+        ]
+    )
+    assert dtype.itemsize == RECORD.size
+    return dtype
+
+
+# Answers are appended to a binary file of fixed-width records, and user
+# and category names are stored once in a names file (one JSON string per
+# line, the line number is the id). Reports scan the records in place
+# through a memory map, with numpy if it is installed, so they stay fast
+# with millions of answers
+class EventLog:
+    def __init__(self, path):
+        self.path = path
+        self.names_path = f"{path}.names"
+        self.lock_path = f"{path}.lock"
+        self.names = []
+        self.ids = {}
+        self.names_offset = 0
+        # Answers are recorded from the multiplayer server's thread too
+        self.lock = threading.Lock()
+
+    # Append one answer. mode is one of MODES
+    def record(self, username, question, correct, seconds, mode):
+        with self.lock, locked(self.lock_path):
+            self._refresh_names()
+            difficulty = question.difficulty
+            data = RECORD.pack(
+                time.time(),
+                int(question.hash[:16], 16),
+                self._name_id(username),
+                self._name_id(question.category),
+                seconds,
+                DIFFICULTIES.index(difficulty) if difficulty in DIFFICULTIES else 0,
+                MODES.index(mode),
+                bool(correct),
+            )
+            with open(self.path, "ab") as file:
+                # A crash can leave a partial record behind, so it is
+                # dropped before appending
+                size = file.seek(0, os.SEEK_END)
+                file.truncate(size - size % RECORD.size)
+                file.write(data)
+
+    # Report on a user's answers, or None if they have not answered anything:
+    # {'answers', 'correct', 'categories' and 'difficulties' as [(name,
+    # answers, correct)], 'longest_streak', 'current_streak', 'percentiles'
+    # as [(percentile, seconds)]}
+    def stats(self, username):
+        with self.lock, locked(self.lock_path, exclusive=False):
+            self._refresh_names()
+            user = self.ids.get(username)
+            try:
+                size = os.path.getsize(self.path) // RECORD.size
+            except FileNotFoundError:
+                size = 0
+        if user is None or not size:
+            return None
+        with open(self.path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                try:
+                    import numpy
+                except ImportError:
+                    return self._scan(data, size, user)
+                return self._scan_numpy(numpy, data, size, user)
+
+    def _scan_numpy(self, numpy, data, size, user):
+        records = numpy.frombuffer(data, record_dtype(numpy), size)
+        records = records[records["user"] == user]
+        if not len(records):
+            return None
+        correct = records["correct"].astype(bool)
+        wrong = numpy.flatnonzero(~correct)
+        # Streaks are the runs of correct answers between wrong ones
+        bounds = numpy.concatenate(([-1], wrong, [len(correct)]))
+        categories = numpy.bincount(records["category"])
+        categories_correct = numpy.bincount(records["category"], weights=correct)
+        difficulties = numpy.bincount(records["difficulty"], minlength=len(DIFFICULTIES))
+        difficulties_correct = numpy.bincount(
+            records["difficulty"], weights=correct, minlength=len(DIFFICULTIES)
+        )
+        seconds = numpy.percentile(records["seconds"], PERCENTILES)
+        del records
+        return self._report(
+            len(correct),
+            int(correct.sum()),
+            {
+                name: (int(categories[id]), int(categories_correct[id]))
+                for id, name in enumerate(self.names[: len(categories)])
+                if categories[id]
+            },
+            {
+                name: (int(difficulties[id]), int(difficulties_correct[id]))
+                for id, name in enumerate(DIFFICULTIES)
+                if difficulties[id]
+            },
+            int(numpy.diff(bounds).max()) - 1,
+            len(correct) - 1 - int(wrong[-1]) if len(wrong) else len(correct),
+            [float(value) for value in seconds],
+        )
+
+    # Same as _scan_numpy without numpy, one record at a time
+    def _scan(self, data, size, user):
+        answers = correct = longest = current = 0
+        categories = {}
+        difficulties = {}
+        seconds = array("f")
+        view = memoryview(data)[: size * RECORD.size]
+        for _, _, record_user, category, elapsed, difficulty, _, right in RECORD.iter_unpack(view):
+            if record_user != user:
+                continue
+            answers += 1
+            correct += right
+            current = current + 1 if right else 0
+            longest = max(longest, current)
+            for counts, key in (
+                (categories, self.names[category]),
+                (difficulties, DIFFICULTIES[difficulty]),
+            ):
+                total, total_correct = counts.get(key, (0, 0))
+                counts[key] = (total + 1, total_correct + right)
+            seconds.append(elapsed)
+        view.release()
+        if not answers:
+            return None
+        seconds = sorted(seconds)
+        return self._report(
+            answers,
+            correct,
+            categories,
+            difficulties,
+            longest,
+            current,
+            [percentile(seconds, value) for value in PERCENTILES],
+        )
+
+    def _report(self, answers, correct, categories, difficulties, longest, current, seconds):
+        return {
+            "answers": answers,
+            "correct": correct,
+            "categories": sorted(
+                ((name, *counts) for name, counts in categories.items()),
+                key=lambda row: (-row[1], row[0]),
+            ),
+            "difficulties": [
+                (name, *difficulties[name]) for name in DIFFICULTIES if name in difficulties
+            ],
+            "longest_streak": longest,
+            "current_streak": current,
+            "percentiles": list(zip(PERCENTILES, seconds)),
+        }
+
+    # Must be called with the lock held
+    def _name_id(self, name):
+        id = self.ids.get(name)
+        if id is None:
+            with open(self.names_path, "a") as file:
+                file.write(json.dumps(name) + "\n")
+            self.names_offset = os.path.getsize(self.names_path)
+            id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = id
+        return id
+
+    # Read the names other processes added since the last call
+    def _refresh_names(self):
+        try:
+            with open(self.names_path, "rb") as file:
+                file.seek(self.names_offset)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    name = json.loads(line)
+                    self.ids.setdefault(name, len(self.names))
+                    self.names.append(name)
+                    self.names_offset += len(line)
+        except FileNotFoundError:
+            pass
+
+
+# Percentile of sorted values, interpolating between the closest two like
+# numpy.percentile
+def percentile(values, value):
+    rank = (len(values) - 1) * value / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
@@ -0,0 +1,107 @@
+# Shared HTTP client for TuiTrivia
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RETRIES = 2
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 10
+RETRY_STATUSES = (502, 503, 504)
+
+
+# Raised for any failed request, so callers don't need to import requests
+class HttpError(Exception):
+    pass
+
+
+class HttpClient:
+    def __init__(
+        self,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        pool_size=POOL_SIZE,
+        metrics=None,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self._session = None
+        self._errors = ()
+        # Optional Metrics the latency of every request is recorded in, as
+        # kind "http" named by method, host and path
+        self.metrics = metrics
+        self.lock = threading.Lock()
+
+    # requests is slow to import, so it is only loaded for the first request
+    @property
+    def session(self):
+        with self.lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                # Only idempotent methods are retried, POST requests are sent once
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=RETRY_STATUSES,
+                    raise_on_status=False,
+                )
+                # One keep-alive connection pool per host, shared by every call
+                adapter = HTTPAdapter(pool_maxsize=self.pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._errors = requests.exceptions.RequestException
+            return self._session
+
+    def set_timeouts(self, connect_timeout, read_timeout):
+        self.timeout = (connect_timeout, read_timeout)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        parts = urlsplit(url)
+        endpoint = f"{method} {parts.netloc}{parts.path}"
+        start = time.perf_counter()
+        failed = True
+        session = self.session
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = False
+            return response
+        except self._errors as e:
+            raise HttpError(str(e)) from e
+        finally:
+            self._record(endpoint, time.perf_counter() - start, failed)
+
+    # Iterate over the body of a response requested with stream=True,
+    # failures while reading raise HttpError too
+    def iter_content(self, response, chunk_size):
+        try:
+            yield from response.iter_content(chunk_size)
+        except self._errors as e:
+            raise HttpError(str(e)) from e
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def _record(self, endpoint, elapsed, failed):
+        if self.metrics is not None:
+            self.metrics.observe("http", endpoint, elapsed, failed)
@@ -0,0 +1,256 @@
+# Bulk question imports for TuiTrivia
+
+import csv
+import html
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from jsonstream import iter_array
+from question_store import question_hash
+
+DIFFICULTY_LEVELS = ("easy", "medium", "hard")
+READ_SIZE = 65536
+# Records per task sent to a worker process, and questions per commit to
+# the question bank
+CHUNK_SIZE = 2000
+BATCH_SIZE = 20000
+# Seconds between progress reports
+PROGRESS_INTERVAL = 0.5
+# Invalid records kept for the report, the rest are only counted
+MAX_FAILURES = 20
+# Hashes looked up per query, below SQLite's limit on query parameters
+LOOKUP_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (hash BLOB PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (covered INTEGER NOT NULL);
+"""
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+        # (record number, reason) for the first MAX_FAILURES invalid records
+        self.failures = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def fail(self, number, reason):
+        self.invalid += 1
+        if len(self.failures) < MAX_FAILURES:
+            self.failures.append((number, reason))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def rate(self):
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+
+# Hashes of every question in a question bank, kept next to its index files
+# so imports can skip questions the bank already has without reading it.
+# Questions added some other way (addcustom) are hashed at the start of the
+# next import
+class HashIndex:
+    def __init__(self, bank):
+        self.bank = bank
+        bank.count()
+        self.db = sqlite3.connect(os.path.join(bank.index_dir, "hashes.db"), timeout=30)
+        self.db.executescript(SCHEMA)
+
+    def covered(self):
+        row = self.db.execute("SELECT covered FROM meta").fetchone()
+        return row[0] if row else 0
+
+    # Hash the questions added since the last import
+    def sync(self):
+        covered = self.covered()
+        if covered > self.bank.count():
+            # The bank was replaced, start over
+            self.db.execute("DELETE FROM hashes")
+            covered = 0
+        self.insert(question_hash(question) for question in self.bank.since(covered))
+        self.commit()
+
+    # Insert hashes and return a flag per hash, True if it was new. Nothing
+    # is saved until commit()
+    def insert(self, hashes):
+        keys = [bytes.fromhex(value) for value in hashes]
+        known = set()
+        for start in range(0, len(keys), LOOKUP_SIZE):
+            part = keys[start : start + LOOKUP_SIZE]
+            query = f"SELECT hash FROM hashes WHERE hash IN ({','.join('?' * len(part))})"
+            known.update(row[0] for row in self.db.execute(query, part))
+        new = []
+        for key in keys:
+            new.append(key not in known)
+            known.add(key)
+        self.db.executemany(
+            "INSERT INTO hashes VALUES (?)", [(key,) for key, added in zip(keys, new) if added]
+        )
+        return new
+
+    def commit(self):
+        self.db.execute("DELETE FROM meta")
+        self.db.execute("INSERT INTO meta VALUES (?)", (self.bank.count(),))
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+
+# Function to read the raw records of a question dump: a JSON array or an
+# OpenTDB response ({"results": [...]}), JSON lines (.jsonl) or CSV with a
+# header row (.csv). Yields (record number, record) pairs as the file is read
+def read_records(path):
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, "rb") as file:
+            for number, line in enumerate(file, 1):
+                if line.strip():
+                    yield number, line
+    elif path.endswith(".csv"):
+        with open(path, "r", newline="") as file:
+            yield from enumerate(csv.DictReader(file), 1)
+    else:
+        with open(path, "rb") as file:
+            chunks = iter(lambda: file.read(READ_SIZE), b"")
+            yield from enumerate(iter_array(chunks, "results"), 1)
+
+
+# Function to turn a CSV row into a question. Incorrect answers are separated
+# by "|" and tags by ",", like in addcustom
+def from_csv(row):
+    question = dict(row)
+    answers = question.get("incorrect_answers") or ""
+    question["incorrect_answers"] = [answer for answer in answers.split("|") if answer]
+    tags = question.pop("tags", None) or ""
+    tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    if tags:
+        question["tags"] = tags
+    return {field: value for field, value in question.items() if value not in (None, "")}
+
+
+# Function to validate and decode one record. Returns (hash, question) or a
+# string saying why the record is invalid
+def prepare(record):
+    if isinstance(record, bytes):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            return "Invalid JSON"
+    if not isinstance(record, dict):
+        return "Not an object"
+    text = record.get("question")
+    correct_answer = record.get("correct_answer")
+    incorrect_answers = record.get("incorrect_answers")
+    if not isinstance(text, str) or not text.strip():
+        return "Missing question"
+    if not isinstance(correct_answer, str) or not correct_answer.strip():
+        return "Missing correct_answer"
+    if (
+        not isinstance(incorrect_answers, list)
+        or not incorrect_answers
+        or not all(isinstance(answer, str) for answer in incorrect_answers)
+    ):
+        return "Missing incorrect_answers"
+    question = {
+        "question": html.unescape(text),
+        "correct_answer": html.unescape(correct_answer),
+        "incorrect_answers": [html.unescape(answer) for answer in incorrect_answers],
+    }
+    category = record.get("category")
+    if isinstance(category, str) and category:
+        question["category"] = html.unescape(category)
+    difficulty = record.get("difficulty")
+    if difficulty:
+        if not isinstance(difficulty, str) or difficulty.lower() not in DIFFICULTY_LEVELS:
+            return "Invalid difficulty"
+        question["difficulty"] = difficulty.lower()
+    tags = record.get("tags")
+    if tags:
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            return "Invalid tags"
+        question["tags"] = [html.unescape(tag) for tag in tags]
+    return question_hash(question), question
+
+
+# Run in the worker processes
+def prepare_chunk(records, csv_rows=False):
+    if csv_rows:
+        return [(number, prepare(from_csv(record))) for number, record in records]
+    return [(number, prepare(record)) for number, record in records]
+
+
+# Function to import every question of a dump into a question bank. Records
+# are read as the file is parsed, prepared in `workers` processes, and
+# committed BATCH_SIZE at a time, skipping questions the bank already has.
+# progress(result) is called every PROGRESS_INTERVAL seconds. Batches
+# committed before an error stay imported, so a failed import can simply be
+# run again
+def import_questions(path, bank, workers=None, progress=None):
+    workers = workers or os.cpu_count() or 1
+    result = ImportResult()
+    index = HashIndex(bank)
+    batch = []
+    reported = time.perf_counter()
+
+    def commit():
+        new = index.insert(hash for hash, _ in batch)
+        questions = [question for (_, question), added in zip(batch, new) if added]
+        try:
+            if questions:
+                bank.add_many(questions)
+        except BaseException:
+            index.rollback()
+            raise
+        index.commit()
+        result.added += len(questions)
+        result.duplicates += len(batch) - len(questions)
+        batch.clear()
+
+    def collect(future):
+        nonlocal reported
+        for number, prepared in future.result():
+            result.read += 1
+            if isinstance(prepared, str):
+                result.fail(number, prepared)
+            else:
+                batch.append(prepared)
+        if len(batch) >= BATCH_SIZE:
+            commit()
+        if progress and time.perf_counter() - reported >= PROGRESS_INTERVAL:
+            reported = time.perf_counter()
+            progress(result)
+
+    try:
+        index.sync()
+        records = read_records(path)
+        csv_rows = path.endswith(".csv")
+        # Futures are collected in order, and at most two chunks per worker
+        # are in flight so the file is only read as fast as it is prepared
+        pending = deque()
+        with ProcessPoolExecutor(workers) as executor:
+            while chunk := list(islice(records, CHUNK_SIZE)):
+                if len(pending) >= workers * 2:
+                    collect(pending.popleft())
+                pending.append(executor.submit(prepare_chunk, chunk, csv_rows))
+            while pending:
+                collect(pending.popleft())
+        if batch:
+            commit()
+    finally:
+        index.close()
+    return result.finish()
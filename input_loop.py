@@ -0,0 +1,60 @@
+# Line input with deadlines for TuiTrivia
+#
+# read_line() works like input(), and can also give up at a deadline. On a
+# terminal it waits on stdin with a selector, so a countdown can be redrawn
+# while the player types and the prompt is abandoned as soon as time runs
+# out. Anywhere else (pipes, scripts, Windows consoles) the line is read as
+# usual, and a line that arrives after the deadline is discarded.
+
+import os
+import sys
+import time
+
+# Seconds between calls to tick() while waiting
+TICK_INTERVAL = 1
+
+
+# Function to read a line like input(). With a timeout in seconds it returns
+# None if no line was entered in time. On a terminal tick(seconds_left) is
+# called about once a second while waiting, e.g. to redraw a countdown
+def read_line(prompt="", timeout=None, tick=None):
+    if timeout is None:
+        return input(prompt)
+    deadline = time.perf_counter() + timeout
+    stdin = sys.stdin
+    # Streams that are not files, like daemon sessions, keep the deadline
+    # themselves
+    read = getattr(stdin, "read_line", None)
+    if read is not None:
+        return read(prompt, timeout)
+    if os.name == "nt" or not stdin.isatty():
+        line = input(prompt)
+        return line if time.perf_counter() < deadline else None
+    import selectors
+
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    with selectors.DefaultSelector() as selector:
+        selector.register(stdin, selectors.EVENT_READ)
+        while True:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                discard_typeahead(stdin)
+                return None
+            if tick:
+                tick(left)
+            if selector.select(min(left, TICK_INTERVAL) if tick else left):
+                line = stdin.readline()
+                if not line:
+                    raise EOFError()
+                return line.rstrip("\n")
+
+
+# Function to drop a half-typed answer, so it is not read by the next prompt
+def discard_typeahead(stdin):
+    try:
+        import termios
+
+        termios.tcflush(stdin.fileno(), termios.TCIFLUSH)
+    except (ImportError, OSError):
+        pass
@@ -0,0 +1,65 @@
+# JSON over HTTP plumbing shared by the leaderboard server and the stub
+# APIs of the benchmark suite
+
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Errors of a client that went away, e.g. one that stopped reading a
+# streamed leaderboard or closed a keep-alive connection
+DROPPED = (BrokenPipeError, ConnectionResetError)
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without TCP_NODELAY every
+    # keep-alive response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        try:
+            super().handle()
+        except DROPPED:
+            pass
+
+    def send_json(self, status, data, headers=None):
+        self.read_body()
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except DROPPED:
+            pass
+
+    def parse_request(self):
+        self.body = None
+        return super().parse_request()
+
+    # The request body, read once. Every response reads it first, so an
+    # unread body is never parsed as the next request on the connection
+    def read_body(self):
+        if self.body is None:
+            self.body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        return self.body
+
+    # The request body as a JSON object, or None if it is not one
+    def read_json(self):
+        try:
+            data = json.loads(self.read_body() or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+class JsonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # A connection dropped while its response is flushed is not an error
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], DROPPED):
+            super().handle_error(request, client_address)
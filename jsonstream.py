@@ -0,0 +1,105 @@
+# Incremental parsing of JSON arrays for TuiTrivia
+
+import codecs
+import json
+
+WHITESPACE = " \t\n\r"
+
+
+# Function to yield the items of a JSON array as its bytes arrive. Only the
+# item being parsed and the current chunk are kept in memory, so the caller
+# can stop after the first few items of a huge array without reading the rest.
+# With a field name the document may also be an object, and the items of the
+# array under that key are yielded ({"results": [...]} from OpenTDB)
+def iter_array(chunks, field=None):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    finished = False
+
+    # Read the next chunk, returns False once the input is exhausted
+    def more():
+        nonlocal buffer, position, finished
+        if finished:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+            buffer = buffer[position:] + text.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + text.decode(chunk)
+        position = 0
+        return True
+
+    # Skip whitespace and return the next character, or "" at the end
+    def peek():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not more():
+                return ""
+
+    # Decode the value at the current position, reading more input until it
+    # is complete
+    def decode(separators):
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number cut off by the end of a chunk still decodes ("12"
+                # of "12.5"), so a value only counts once a separator follows
+                after = end
+                while after < len(buffer) and buffer[after] in WHITESPACE:
+                    after += 1
+                if not finished and (
+                    after == len(buffer) or buffer[after] not in separators
+                ):
+                    raise json.JSONDecodeError("Incomplete value", buffer, end)
+            except json.JSONDecodeError:
+                if not more():
+                    raise
+                continue
+            position = end
+            return value
+
+    # Skip the object's members up to the value of `field`
+    def find_field():
+        nonlocal position
+        position += 1
+        while peek() == '"':
+            key = decode(":")
+            if peek() != ":":
+                raise ValueError("Expected ':' in JSON object")
+            position += 1
+            if key == field:
+                return
+            peek()
+            decode(",}")
+            if peek() != ",":
+                break
+            position += 1
+            peek()
+        raise ValueError(f"Expected a {field!r} array")
+
+    if field is not None and peek() == "{":
+        find_field()
+    if peek() != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    if peek() == "]":
+        return
+    while True:
+        item = decode(",]")
+        yield item
+        separator = peek()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError("Expected ',' or ']' in JSON array")
+        position += 1
+        peek()
@@ -0,0 +1,75 @@
+# Leaderboard cache for TuiTrivia
+
+import threading
+import time
+
+LEADERBOARD_TTL = 30
+
+
+# One cached copy per page of the leaderboard. A page is identified by a
+# key such as (limit, offset), the whole board uses the key None
+class CachedPage:
+    def __init__(self):
+        self.entries = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = None
+
+
+class LeaderboardCache:
+    def __init__(self, ttl=LEADERBOARD_TTL):
+        self.ttl = ttl
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    # Cached entries if they are younger than the TTL, otherwise None
+    def get(self, key=None):
+        with self.lock:
+            page = self.pages.get(key)
+            if (
+                page is not None
+                and page.fetched_at is not None
+                and time.monotonic() - page.fetched_at < self.ttl
+            ):
+                return page.entries
+            return None
+
+    # Conditional request headers for revalidating a stale copy
+    def validators(self, key=None):
+        with self.lock:
+            headers = {}
+            page = self.pages.get(key)
+            if page is not None and page.entries is not None:
+                if page.etag:
+                    headers["If-None-Match"] = page.etag
+                if page.last_modified:
+                    headers["If-Modified-Since"] = page.last_modified
+            return headers
+
+    def store(self, entries, headers, key=None):
+        with self.lock:
+            page = self.pages.setdefault(key, CachedPage())
+            page.entries = entries
+            page.etag = headers.get("ETag")
+            page.last_modified = headers.get("Last-Modified")
+            page.fetched_at = time.monotonic()
+
+    # The server confirmed the cached copy is still current (304)
+    def revalidated(self, key=None):
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                return None
+            page.fetched_at = time.monotonic()
+            return page.entries
+
+    # Force the next read to go to the server, e.g. after our own write
+    def invalidate(self):
+        with self.lock:
+            for page in self.pages.values():
+                page.fetched_at = None
+
+    # Drop everything, e.g. after switching to another API
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
@@ -0,0 +1,282 @@
+# Self-hosted leaderboard server for TuiTrivia
+#
+# Implements the endpoints the game uses (/add_score, /leaderboard,
+# /clear_leaderboard and /edit_user) with the same request and response
+# shapes as the hosted API, plus /add_scores and /edit_users to send many
+# at once. Scores are kept in memory in a ranked skip list and snapshotted
+# to disk periodically.
+
+import argparse
+import hmac
+import json
+import os
+import threading
+from hashlib import sha256
+from urllib.parse import parse_qs, urlsplit
+
+from json_http import JsonHandler, JsonServer
+from ranking import Ranking
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+SNAPSHOT_FILE = "leaderboard.json"
+SNAPSHOT_INTERVAL = 10
+
+
+class Leaderboard:
+    def __init__(self, path=SNAPSHOT_FILE):
+        self.path = path
+        self.scores = {}
+        self.ranking = Ranking()
+        # Bumped on every change, used as the leaderboard's ETag
+        self.version = 0
+        self.saved_version = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as file:
+            for entry in json.load(file):
+                self.scores[entry["username"]] = {"score": entry["score"], "date": entry["date"]}
+                self.ranking.set(entry["username"], entry["score"])
+
+    # Write the board in rank order if it changed since the last snapshot
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if self.version == self.saved_version:
+                    return
+                version = self.version
+                entries = self._entries(self.ranking.top())
+            temp = f"{self.path}.tmp"
+            with open(temp, "w") as file:
+                json.dump(entries, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, self.path)
+            self.saved_version = version
+
+    def set(self, username, score, date):
+        with self.lock:
+            self.scores[username] = {"score": score, "date": date}
+            self.ranking.set(username, score)
+            self.version += 1
+
+    # Rename a user and replace their score, returns False if they are unknown
+    def edit(self, old_username, new_username, score, date):
+        with self.lock:
+            if old_username not in self.scores:
+                return False
+            del self.scores[old_username]
+            self.ranking.remove(old_username)
+            self.scores[new_username] = {"score": score, "date": date}
+            self.ranking.set(new_username, score)
+            self.version += 1
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.scores.clear()
+            self.ranking.clear()
+            self.version += 1
+
+    # A page of the board, best first, and the board's version
+    def top(self, count=None, offset=0):
+        with self.lock:
+            return self._entries(self.ranking.top(count, offset)), self.version
+
+    def rank(self, username):
+        with self.lock:
+            rank = self.ranking.rank(username)
+            if rank is None:
+                return None
+            return {"username": username, "rank": rank, **self.scores[username]}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.scores)
+
+    def _entries(self, ranked):
+        return [
+            {"username": username, "score": score, "date": self.scores[username]["date"]}
+            for username, score in ranked
+        ]
+
+
+class LeaderboardHandler(JsonHandler):
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def authorized(self):
+        key = self.headers.get("API-Key", "")
+        if self.server.api_key_hash and hmac.compare_digest(key, self.server.api_key_hash):
+            return True
+        self.send_json(403, {"error": "Unauthorized"})
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        board = self.server.board
+        match url.path:
+            case "/leaderboard":
+                try:
+                    limit = int(params["limit"]) if "limit" in params else None
+                    offset = int(params.get("offset", 0))
+                except ValueError:
+                    return self.send_json(400, {"error": "Invalid limit or offset"})
+                entries, version = board.top(limit, offset)
+                etag = f'"{version}"'
+                # The applied page is echoed, so clients know the board was
+                # paged for them
+                headers = {
+                    "ETag": etag,
+                    "X-Total-Count": str(len(board)),
+                    "X-Offset": str(offset),
+                }
+                if limit is not None:
+                    headers["X-Limit"] = str(limit)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_json(200, entries, headers)
+            case "/rank":
+                entry = board.rank(params.get("username", ""))
+                if entry is None:
+                    return self.send_json(404, {"error": "User not found"})
+                self.send_json(200, entry)
+            case _:
+                self.send_json(404, {"error": "Not found"})
+
+    # Apply one score, returns the status and response body
+    def add_score(self, data):
+        if (
+            not isinstance(data, dict)
+            or not isinstance(data.get("score"), int)
+            or not data.get("username")
+        ):
+            return 400, {"error": "Invalid score"}
+        self.server.board.set(str(data["username"]), data["score"], str(data.get("date", "")))
+        return 201, {"message": "Score added successfully"}
+
+    # Apply one user edit, returns the status and response body
+    def edit_user(self, data):
+        fields = ("old_username", "new_username", "new_score", "new_date")
+        if not isinstance(data, dict) or any(field not in data for field in fields):
+            return 400, {"error": "Invalid user entry"}
+        if not isinstance(data["new_score"], int):
+            return 400, {"error": "Invalid user entry"}
+        if not self.server.board.edit(
+            str(data["old_username"]),
+            str(data["new_username"]),
+            data["new_score"],
+            str(data["new_date"]),
+        ):
+            return 404, {"error": "User not found"}
+        return 200, {"message": "User entry updated successfully"}
+
+    # Apply every item of a batch request, the response has one
+    # {"status", "message" or "error"} result per item, in order
+    def batch(self, field, apply):
+        data = self.read_json()
+        if not data or not isinstance(data.get(field), list):
+            return self.send_json(400, {"error": f"Expected a list of {field}"})
+        results = []
+        for item in data[field]:
+            status, body = apply(item)
+            results.append({"status": status, **body})
+        self.send_json(200, {"results": results})
+
+    def do_POST(self):
+        match self.path:
+            case "/add_score":
+                data = self.read_json()
+                self.send_json(*self.add_score(data))
+            case "/add_scores":
+                self.batch("scores", self.add_score)
+            case _:
+                self.send_json(404, {"error": "Not found"})
+
+    def do_PUT(self):
+        if self.path not in ("/edit_user", "/edit_users"):
+            return self.send_json(404, {"error": "Not found"})
+        if not self.authorized():
+            return
+        if self.path == "/edit_users":
+            return self.batch("edits", self.edit_user)
+        self.send_json(*self.edit_user(self.read_json()))
+
+    def do_DELETE(self):
+        if self.path != "/clear_leaderboard":
+            return self.send_json(404, {"error": "Not found"})
+        if not self.authorized():
+            return
+        self.server.board.clear()
+        self.send_json(200, {"message": "Leaderboard cleared successfully"})
+
+
+class LeaderboardServer(JsonServer):
+    handler = LeaderboardHandler
+
+    def __init__(self, address, board, api_key=None, verbose=False):
+        super().__init__(address, self.handler)
+        self.board = board
+        # The game sends the SHA-256 hash of the admin key it was given
+        self.api_key_hash = sha256(api_key.encode()).hexdigest() if api_key else None
+        self.verbose = verbose
+        self.stopped = threading.Event()
+
+    # Snapshot the board every interval seconds until the server shuts down
+    def snapshot_periodically(self, interval=SNAPSHOT_INTERVAL):
+        def run():
+            while not self.stopped.wait(interval):
+                self.board.save()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def server_close(self):
+        self.stopped.set()
+        super().server_close()
+        self.board.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TuiTrivia leaderboard server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--snapshot", default=SNAPSHOT_FILE, help="file the board is saved to"
+    )
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL)
+    parser.add_argument(
+        "--api-key",
+        default=os.environ.get("TUITRIVIA_API_KEY"),
+        help="admin key for cleardb/editdb (default: $TUITRIVIA_API_KEY)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    server = LeaderboardServer(
+        (args.host, args.port), Leaderboard(args.snapshot), args.api_key, args.verbose
+    )
+    server.snapshot_periodically(args.snapshot_interval)
+    print(f"Serving the TuiTrivia leaderboard on {args.host}:{args.port}")
+    if not args.api_key:
+        print("No API key set, admin endpoints are disabled")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,77 @@
 # TuiTrivia: A trivia game for the terminal
 
 # Imports
-import requests
-import json
 import os
-import random
-from pwinput import pwinput
+import sys
+import threading
+import time
 from player import Player
+from question import Question
+from render import Screen, page
+from input_loop import read_line
+from http_client import HttpClient, HttpError
+from question_buffer import QuestionBuffer
+from question_store import QuestionStore
+from leaderboard_cache import LeaderboardCache
+from circuit import CircuitBreaker
+from metrics import Metrics
+from score_sync import ScoreOutbox
+from score_store import ScoreStore
+from events import EventLog
+from user_store import UserStore
+from question_bank import QuestionBank
+from sampler import QuestionSampler
 from termcolor import colored
 from hashlib import sha256
+from itertools import islice
+from jsonstream import iter_array
 from datetime import datetime
 
 # Constants
-TRIVIA_API_URL = "https://opentdb.com/api.php?amount=1&type=multiple"
+OPENTDB_URL = "https://opentdb.com"
 SCORES_FILE = "scores.json"
-USERS_FILE = "users.json"
-CUSTOM_QUESTIONS_FILE = "custom_questions.json"
+USERS_FILE = "users.db"
+LEGACY_USERS_FILE = "users.json"
+CUSTOM_QUESTIONS_FILE = "custom_questions.jsonl"
+LEGACY_CUSTOM_QUESTIONS_FILE = "custom_questions.json"
+QUESTIONS_DB = "questions.db"
+SCORE_OUTBOX_DIR = "score_outbox"
+SEEN_DIR = "seen"
+EVENTS_FILE = "events.log"
+DAEMON_SOCKET = "tuitrivia.sock"
 DEV_MODE = False  # Set to True to enable debug commands by default
+OFFLINE = False  # Set to True to only use questions from the local store
+
+# Network timeouts (in seconds) and retry budget for every API call
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RETRIES = 2
+
+# Seconds a downloaded leaderboard is reused before asking the API again
+LEADERBOARD_TTL = 30
+# Seconds score updates are collected before being sent to the leaderboard
+SCORE_FLUSH_INTERVAL = 2
+# Failed leaderboard calls in a row before scores are kept local only, and
+# seconds between checks on whether the leaderboard API is back
+LEADERBOARD_FAILURE_THRESHOLD = 3
+LEADERBOARD_PROBE_INTERVAL = 15
+LEADERBOARD_DOWN = "The leaderboard API is unavailable, try again later"
+# Requests in flight during bulk admin operations, and rows per request
+# when the server has batch endpoints
+ADMIN_WORKERS = 8
+ADMIN_BATCH_SIZE = 500
+# Leaderboard rows shown above each question of a trivia streak
+HIGH_SCORE_ROWS = 10
+# Leaderboard rows per page of 'scores global'
+GLOBAL_SCORE_ROWS = 100
+# Bytes of the leaderboard read at a time while it downloads
+LEADERBOARD_CHUNK_SIZE = 16384
 
 # Add difficulty and category constants
 DIFFICULTY = "easy"
+# Seconds to answer each question, an answer not given in time counts as
+# wrong. None for no time limit
+ANSWER_DEADLINE = None
 DIFFICULTY_LEVELS = ["easy", "medium", "hard"]
 CATEGORY = "General Knowledge"
 
@@ -52,67 +104,259 @@ CATEGORIES = {
 
 API_URL = "https://uiriviaeapelleployment-yousseftechdev4943-he442368.leapcell.dev"
 
+# Port networked multiplayer games are hosted on unless one is given
+MULTIPLAYER_PORT = 5555
+
+
+# Function to read a password or API key without echoing it
+def read_hidden(prompt):
+    from pwinput import pwinput
+
+    return pwinput(prompt)
+
+
+# Passwords and API keys are read without echoing them, except in scripts
+read_password = read_hidden
+
+screen = Screen()
+
+
+# Settings and credentials of the player's session, starting from the
+# constants above. The daemon gives every session it serves its own
+class SessionState:
+    def __init__(self):
+        self.dev_mode = DEV_MODE
+        self.offline = OFFLINE
+        self.difficulty = DIFFICULTY
+        self.category = CATEGORY
+        self.deadline = ANSWER_DEADLINE
+        # Hash of the admin API key, asked for once per session
+        self.api_key_hash = None
+        # Remembers which questions the player has seen, set at login
+        self.sampler = None
+
+
+state = SessionState()
+
+# Latency of every command, API call and file access, see 'debug stats'
+metrics = Metrics()
+http = HttpClient(CONNECT_TIMEOUT, READ_TIMEOUT, MAX_RETRIES, metrics=metrics)
+leaderboard_cache = LeaderboardCache(LEADERBOARD_TTL)
+
+# Function to fetch a batch of trivia questions and cache them locally
+def fetch_questions(amount, difficulty, category, token=None):
+    params = {"amount": amount, "type": "multiple", "category": CATEGORIES[category]}
+    if difficulty:
+        params["difficulty"] = difficulty
+    if token:
+        params["token"] = token
+    try:
+        response = http.get(f"{OPENTDB_URL}/api.php", params=params)
+    except HttpError:
+        return None
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get("response_code") == 0:
+        with metrics.timer("file", "questions.save"):
+            question_store.add(data["results"], CATEGORIES[category])
+        data["results"] = [Question.from_dict(question) for question in data["results"]]
+    return data
+
+
+# Function to fetch questions for the question buffer using the player's
+# session token, so the API does not send questions they already had. A
+# token that is passed in, like the one of 'sync', is used as it is
+def fetch_session_questions(amount, difficulty, category, token=None):
+    if token or state.sampler is None:
+        return fetch_questions(amount, difficulty, category, token)
+    data = fetch_questions(amount, difficulty, category, state.sampler.session_token())
+    code = data.get("response_code") if data else None
+    if code == 3:
+        # Token not found, it expired
+        state.sampler.token_expired()
+    elif code == 4:
+        # Token empty, every question for this category has been served
+        state.sampler.token_exhausted(question_bucket(difficulty, category))
+    else:
+        return data
+    return fetch_questions(amount, difficulty, category, state.sampler.session_token())
+
+
+question_store = QuestionStore(QUESTIONS_DB)
+question_buffer = QuestionBuffer(fetch_session_questions)
+
+
+# Function to pick a random question from the local store
+@metrics.timed("file", "questions.random")
+def stored_question(category, difficulty):
+    question = question_store.random(category, difficulty)
+    return Question.from_dict(question) if question else None
+
+
+# Function to name the seen-set bucket of a difficulty/category pair
+def question_bucket(difficulty, category):
+    return f"{CATEGORIES[category]}-{difficulty}"
+
+
 # Function to get a random trivia question
 def get_random_question():
-    response = requests.get(TRIVIA_API_URL)
-    if response.status_code == 200:
-        data = response.json()
-        question = data["results"][0]
+    category = CATEGORIES[state.category]
+    bucket = question_bucket(state.difficulty, state.category)
+
+    waited = False
+
+    # Serve unseen questions from the local store while the buffer is
+    # refilling, and only wait on the network when neither has one. The
+    # buffer is waited on once per question, so a failed refill is not
+    # retried while the API is unreachable
+    def draw():
+        nonlocal waited
+        if state.offline:
+            return stored_question(category, state.difficulty)
+        question = question_buffer.get(state.difficulty, state.category, wait=False)
+        if question is None:
+            question = state.sampler.unseen(bucket, stored_question(category, state.difficulty))
+        if question is None and not waited:
+            waited = True
+            question = question_buffer.get(state.difficulty, state.category)
+        return question
+
+    # Nothing new came up, repeat a stored question rather than none
+    question = state.sampler.pick(bucket, draw) or stored_question(category, state.difficulty)
+    if question:
         return question
     else:
         print(colored("Failed to fetch question", "red"))
         return None
 
 
-# Function to load scores from a file
-def load_scores():
-    if os.path.exists(SCORES_FILE):
-        with open(SCORES_FILE, "r") as file:
-            return json.load(file)
-    else:
-        return {}
+# Function to request an OpenTDB session token
+def request_session_token():
+    try:
+        response = http.get(f"{OPENTDB_URL}/api_token.php", params={"command": "request"})
+    except HttpError:
+        return None
+    if response.status_code == 200:
+        data = response.json()
+        if data.get("response_code") == 0:
+            return data["token"]
+    return None
+
+
+# Function to make OpenTDB forget which questions a session token has served
+def reset_session_token(token):
+    try:
+        response = http.get(
+            f"{OPENTDB_URL}/api_token.php", params={"command": "reset", "token": token}
+        )
+    except HttpError:
+        return False
+    return response.status_code == 200 and response.json().get("response_code") == 0
+
+
+# Function to download every question of a category into the local store
+def sync_category(name):
+    token = request_session_token()
+    if not token:
+        print(colored("Failed to connect to the trivia API", "red"))
+        return
+    amount = 50
+    synced = 0
+    while True:
+        data = question_buffer.request(amount, None, name, token)
+        code = data.get("response_code") if data else None
+        if code == 0:
+            synced += len(data["results"])
+            print(f"\r{name}: {synced} questions", end="", flush=True)
+        elif code == 1 and amount > 1:
+            amount //= 2
+        elif code in (1, 4):
+            break
+        elif code != 5:
+            print()
+            print(colored(f"Failed to sync {name}", "red"))
+            return
+    print()
+    print(colored(f"Synced {synced} questions for {name}", "green"))
 
 
-# Function to save scores to a file
-def save_scores(scores):
-    with open(SCORES_FILE, "w") as file:
-        json.dump(scores, file, indent=4)
+score_store = ScoreStore(SCORES_FILE)
+event_log = EventLog(EVENTS_FILE)
+
+
+# Function to add an answer to the event log, see 'stats'
+@metrics.timed("file", "events.record")
+def record_answer(username, question, correct, seconds, mode):
+    event_log.record(username, question, correct, seconds, mode)
+
+
+# Function to load scores from the score store, best first
+@metrics.timed("file", "scores.load")
+def load_scores():
+    return score_store.all()
 
 
 # Function to update user score
 def update_score(username, score, use_api=True):
-    scores = load_scores()
     date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if username in scores:
-        scores[username]["score"] += score
-        scores[username]["date"] = date
-    else:
-        scores[username] = {"score": score, "date": date}
-    save_scores(scores)
-    
+    with metrics.timer("file", "scores.save"):
+        total = score_store.add(username, score, date)
+
     if use_api:
-        # Send score data to the API
-        data = {
-            'username': username,
-            'score': scores[username]["score"],
-            'date': date
-        }
-        try:
-            response = requests.post(f"{API_URL}/add_score", json=data)
-            if response.status_code == 201:
-                print(colored("Score added to leaderboard", "green"))
-            else:
-                print(colored("Failed to add score to leaderboard", "red"))
-        except requests.exceptions.RequestException:
-            print(colored("Failed to connect to the leaderboard API", "red"))
+        # Queue score data for the API, it is sent in the background
+        score_outbox.put(username, total, date)
+
+
+# Function to check whether the leaderboard API is back, used by the
+# circuit breaker while scores are local only
+def probe_leaderboard():
+    try:
+        response = http.get(f"{API_URL}/leaderboard", params={"limit": 1}, stream=True)
+    except HttpError:
+        return False
+    with response:
+        return response.status_code < 500
+
+
+leaderboard_circuit = CircuitBreaker(
+    probe_leaderboard, LEADERBOARD_FAILURE_THRESHOLD, LEADERBOARD_PROBE_INTERVAL
+)
+
+
+# Function to send a queued score to the leaderboard API. While the API is
+# down scores stay queued without trying to send them
+def submit_score(data):
+    if not leaderboard_circuit.allow():
+        return False
+    try:
+        response = http.post(f"{API_URL}/add_score", json=data)
+    except HttpError:
+        leaderboard_circuit.failure()
+        return False
+    if response.status_code >= 500:
+        leaderboard_circuit.failure()
+    else:
+        leaderboard_circuit.success()
+    if response.status_code == 201:
+        leaderboard_cache.invalidate()
+        if state.dev_mode:
+            print(colored(f"Score for {data['username']} added to leaderboard", "green"))
+        return True
+    if state.dev_mode:
+        print(colored("Failed to add score to leaderboard", "red"))
+    # Server errors are retried on the next flush, rejected scores are dropped
+    return response.status_code < 500
+
+
+score_outbox = ScoreOutbox(SCORE_OUTBOX_DIR, submit_score, SCORE_FLUSH_INTERVAL)
 
 
 # Function to clear score for a user
 def clear_score(username):
-    scores = load_scores()
-    if username in scores:
-        del scores[username]
-        save_scores(scores)
+    with metrics.timer("file", "scores.save"):
+        removed = score_store.remove(username)
+    if removed:
         print(colored(f"Score for {username} cleared", "green"))
     else:
         print(colored(f"No score found for {username}", "red"))
@@ -120,49 +364,107 @@ def clear_score(username):
 
 # Function to clear score for ALL users
 def clear_all_scores():
-    if os.path.exists(SCORES_FILE):
-        os.remove(SCORES_FILE)
+    with metrics.timer("file", "scores.save"):
+        cleared = score_store.clear()
+    if cleared:
         print(colored("All scores cleared", "green"))
     else:
         print(colored("No scores found", "red"))
 
 
-# Function to get high scores
-def get_high_scores(use_api=True):
-    global DEV_MODE
-    if use_api:
-        try:
-            response = requests.get(f"{API_URL}/leaderboard")
-            if DEV_MODE:
+# Function to get high scores, best first. With a limit only that many
+# entries, starting at offset, are returned. The API is asked for just that
+# page. Servers that send the whole board anyway are read as the response
+# downloads, and the download stops as soon as the page is complete. While
+# the API is down the local scores are returned instead
+def get_high_scores(use_api=True, limit=None, offset=0):
+    if not use_api or not leaderboard_circuit.allow():
+        with metrics.timer("file", "scores.top"):
+            return score_store.top(limit, offset)
+    entries = leaderboard_cache.get((limit, offset))
+    if entries is not None:
+        return entries
+    try:
+        return fetch_high_scores(limit, offset)
+    except HttpError:
+        print(colored("Failed to connect to the leaderboard API", "red"))
+        return get_high_scores(False, limit, offset)
+    except ValueError:
+        print(colored("Failed to fetch leaderboard", "red"))
+        return []
+
+
+# Function to download a page of the leaderboard into the cache, or
+# revalidate the cached copy. Raises HttpError if the API can't be reached
+# and ValueError if it does not send a leaderboard
+def fetch_high_scores(limit=None, offset=0):
+    key = (limit, offset)
+    params = {}
+    if limit is not None:
+        params["limit"] = limit
+    if offset:
+        params["offset"] = offset
+    try:
+        response = http.get(
+            f"{API_URL}/leaderboard",
+            params=params,
+            headers=leaderboard_cache.validators(key),
+            stream=True,
+        )
+        with response:
+            if state.dev_mode:
                 print(f"Status Code: {response.status_code}")  # Debugging information
-                print(f"Response Text: {response.text}")  # Debugging information
-            if response.status_code == 200:
-                return response.json()
+                print(f"Headers: {dict(response.headers)}")  # Debugging information
+            if response.status_code >= 500:
+                leaderboard_circuit.failure()
             else:
-                print(colored("Failed to fetch leaderboard", "red"))
-                return []
-        except requests.exceptions.RequestException:
-            print(colored("Failed to connect to the leaderboard API", "red"))
-            return []
-    else:
-        scores = load_scores()
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1]["score"], reverse=True)
-        return [{'username': user, 'score': data['score'], 'date': data['date']} for user, data in sorted_scores]
+                leaderboard_circuit.success()
+            if response.status_code == 304:
+                return leaderboard_cache.revalidated(key) or []
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            # Servers that page the board echo the offset they applied,
+            # others send the whole board and it is paged here
+            applied = response.headers.get("X-Offset")
+            if applied is not None and applied != str(offset):
+                raise ValueError(f"Expected offset {offset}, got {applied}")
+            entries = iter_array(http.iter_content(response, LEADERBOARD_CHUNK_SIZE))
+            if applied is None:
+                entries = islice(entries, offset, None)
+            entries = list(islice(entries, limit))
+            leaderboard_cache.store(entries, response.headers, key)
+            return entries
+    except HttpError:
+        leaderboard_circuit.failure()
+        raise
+
+
+# Function to bring the cached top scores up to date in the background, so
+# the next frame of a streak doesn't wait on the API
+def refresh_high_scores():
+    def refresh():
+        try:
+            fetch_high_scores(HIGH_SCORE_ROWS)
+        except (HttpError, ValueError):
+            pass
+
+    if leaderboard_circuit.allow() and leaderboard_cache.get((HIGH_SCORE_ROWS, 0)) is None:
+        threading.Thread(target=refresh, daemon=True).start()
 
 
-# Function to load users from a file
+user_store = UserStore(USERS_FILE, LEGACY_USERS_FILE)
+
+
+# Function to load every user and their password hash
+@metrics.timed("file", "users.load")
 def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r") as file:
-            return json.load(file)
-    else:
-        return {}
+    return user_store.all()
 
 
-# Function to save users to a file
+# Function to add or update users
+@metrics.timed("file", "users.save")
 def save_users(users):
-    with open(USERS_FILE, "w") as file:
-        json.dump(users, file, indent=4)
+    user_store.update(users)
 
 
 # Function to hash a password
@@ -172,11 +474,12 @@ def hash_password(password):
 
 # Function to authenticate user
 def authenticate_user():
-    users = load_users()
     username = input("Enter your username: ")
-    if username in users:
-        password = pwinput("Enter your password: ")
-        if users[username] == hash_password(password):
+    with metrics.timer("file", "users.lookup"):
+        password_hash = user_store.get(username)
+    if password_hash is not None:
+        password = read_password("Enter your password: ")
+        if password_hash == hash_password(password):
             print(colored("Login successful", "green"))
             return username
         else:
@@ -189,85 +492,208 @@ def authenticate_user():
 
 # Function to register user
 def register_user():
-    users = load_users()
     username = input("Enter a new username: ")
-    if username in users:
+    with metrics.timer("file", "users.lookup"):
+        taken = username in user_store
+    if taken:
+        print(
+            colored(
+                "Username already exists. Please choose a different username.", "red"
+            )
+        )
+        return None
+    password = read_password("Enter a new password: ")
+    # Someone else may have taken the name while the password was typed
+    with metrics.timer("file", "users.save"):
+        added = user_store.add(username, hash_password(password))
+    if not added:
         print(
             colored(
                 "Username already exists. Please choose a different username.", "red"
             )
         )
         return None
-    password = pwinput("Enter a new password: ")
-    users[username] = hash_password(password)
-    save_users(users)
     print(colored("Registration successful", "green"))
     return username
 
 
-# Function to load custom questions from a file
-def load_custom_questions():
-    if os.path.exists(CUSTOM_QUESTIONS_FILE):
-        with open(CUSTOM_QUESTIONS_FILE, "r") as file:
-            return json.load(file)
-    else:
-        return []
+custom_bank = QuestionBank(CUSTOM_QUESTIONS_FILE, LEGACY_CUSTOM_QUESTIONS_FILE)
 
 
-# Function to save custom questions to a file
-def save_custom_questions(questions):
-    with open(CUSTOM_QUESTIONS_FILE, "w") as file:
-        json.dump(questions, file, indent=4)
+# Function to load every custom question from the question bank
+@metrics.timed("file", "custom.load")
+def load_custom_questions():
+    return list(custom_bank)
 
 
 # Function to add a custom question
 def add_custom_question():
-    questions = load_custom_questions()
     question = input("Enter the question: ")
     correct_answer = input("Enter the correct answer: ")
     incorrect_answers = []
     for i in range(3):
         incorrect_answer = input(f"Enter incorrect answer {i+1}: ")
         incorrect_answers.append(incorrect_answer)
-    questions.append(
-        {
-            "question": question,
-            "correct_answer": correct_answer,
-            "incorrect_answers": incorrect_answers,
-        }
-    )
-    save_custom_questions(questions)
+    difficulty = input("Enter the difficulty (easy, medium, hard) or leave empty: ")
+    tags = input("Enter tags (comma separated) or leave empty: ")
+    question = {
+        "question": question,
+        "correct_answer": correct_answer,
+        "incorrect_answers": incorrect_answers,
+    }
+    if difficulty.lower() in DIFFICULTY_LEVELS:
+        question["difficulty"] = difficulty.lower()
+    tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    if tags:
+        question["tags"] = tags
+    with metrics.timer("file", "custom.save"):
+        custom_bank.add(question)
     print(colored("Custom question added", "green"))
 
 
+# Function to import a question dump (OpenTDB JSON, JSON lines or CSV) into
+# the question bank, with the work spread over every CPU
+def import_custom_questions(path):
+    from importer import import_questions
+
+    def progress(result):
+        print(
+            f"{result.read} records read, {result.added} added "
+            f"({result.rate():.0f} records/sec)",
+            end="\r" if screen.tty else "\n",
+            flush=True,
+        )
+
+    try:
+        with metrics.timer("file", "custom.import"):
+            result = import_questions(path, custom_bank, progress=progress)
+    except (OSError, ValueError) as e:
+        print(colored(f"Failed to import {path}: {e}", "red"))
+        return
+    lines = [colored(f"Record {number}: {reason}", "red") for number, reason in result.failures]
+    if result.invalid > len(result.failures):
+        lines.append(colored(f"... and {result.invalid - len(result.failures)} more", "red"))
+    lines.append(
+        colored(
+            f"{result.added} questions added from {result.read} records in "
+            f"{result.elapsed:.2f}s ({result.rate():.0f} records/sec), "
+            f"{result.duplicates} duplicates, {result.invalid} invalid",
+            "green",
+        )
+    )
+    screen.write(lines)
+
+
+# Function to pick a random custom question from the question bank
+@metrics.timed("file", "custom.random")
+def stored_custom_question(difficulty, tag):
+    question = custom_bank.random(difficulty, tag)
+    return Question.from_dict(question) if question else None
+
+
 # Function to get a random custom question
-def get_random_custom_question():
-    questions = load_custom_questions()
-    if questions:
-        return random.choice(questions)
+def get_random_custom_question(difficulty=None, tag=None):
+    question = state.sampler.pick(
+        "custom", lambda: stored_custom_question(difficulty, tag)
+    )
+    if question:
+        return question
     else:
         print(colored("No custom questions available", "red"))
         return None
 
+
+# Function to collect the questions for every round of a hosted game
+def get_multiplayer_questions(count):
+    questions = [get_random_question() for _ in range(count)]
+    questions = [question for question in questions if question]
+    if not questions:
+        raise RuntimeError("Failed to fetch questions")
+    return questions
+
+
+multiplayer_server = None
+
+
+# Function to host a networked multiplayer game and join it
+def host_multiplayer(username, port):
+    global multiplayer_server
+    if multiplayer_server is None:
+        import contextvars
+        from multiplayer_server import MultiplayerServer
+
+        # The server's thread picks questions with the host's session state
+        context = contextvars.copy_context()
+
+        def get_questions(count):
+            return context.copy().run(get_multiplayer_questions, count)
+
+        server = MultiplayerServer(get_questions, on_answer=record_online_answer)
+        try:
+            server.start_in_thread(port=port)
+        except OSError as e:
+            print(colored(f"Failed to start the multiplayer server: {e}", "red"))
+            return
+        multiplayer_server = server
+        print(colored(f"Hosting multiplayer on port {port}", "green"))
+    join_multiplayer(username, "127.0.0.1", port, "lobby")
+
+
+# Function to add an answer from a hosted game to the event log. Called
+# from the server's thread
+def record_online_answer(username, question, correct, seconds):
+    record_answer(username, question, correct, seconds, "online")
+
+
+# Function to join a networked multiplayer game
+def join_multiplayer(username, host, port, room):
+    import asyncio
+    from multiplayer_client import play
+
+    try:
+        asyncio.run(play(host, username, room, port, screen))
+    except OSError as e:
+        print(colored(f"Failed to connect to the multiplayer server: {e}", "red"))
+
+
+# Function to get the headers for admin endpoints, asking for the API key
+# the first time
+def admin_headers():
+    if state.api_key_hash is None:
+        state.api_key_hash = hash_password(read_password("Enter API Key to proceed: "))
+    return {"API-Key": state.api_key_hash}
+
+
+# Function to forget a rejected API key, so the next admin command asks again
+def forget_api_key():
+    state.api_key_hash = None
+
+
 # Function to clear the leaderboard database
 def clear_leaderboard_db():
-    API_KEY = hash_password(pwinput("Enter API Key to proceed: "))
-    headers = {'API-Key': API_KEY}
+    if not leaderboard_circuit.allow():
+        print(colored(LEADERBOARD_DOWN, "red"))
+        return
+    headers = admin_headers()
     try:
-        response = requests.delete(f"{API_URL}/clear_leaderboard", headers=headers)
+        response = http.delete(f"{API_URL}/clear_leaderboard", headers=headers)
         if response.status_code == 200:
+            leaderboard_cache.invalidate()
             print(colored("Leaderboard database cleared successfully", "green"))
         elif response.status_code == 403:
+            forget_api_key()
             print(colored("Unauthorized. Please enter a valid API Key", "red"))
         else:
             print(colored("Failed to clear leaderboard database", "red"))
-    except requests.exceptions.RequestException:
+    except HttpError:
         print(colored("Failed to connect to the leaderboard API", "red"))
 
 # Function to edit a user entry in the leaderboard database
 def edit_user_db(old_username, new_username, new_score, new_date):
-    API_KEY = hash_password(pwinput("Enter API Key to proceed: "))
-    headers = {'API-Key': API_KEY}
+    if not leaderboard_circuit.allow():
+        print(colored(LEADERBOARD_DOWN, "red"))
+        return
+    headers = admin_headers()
     data = {
         'old_username': old_username,
         'new_username': new_username,
@@ -275,311 +701,829 @@ def edit_user_db(old_username, new_username, new_score, new_date):
         'new_date': new_date
     }
     try:
-        response = requests.put(f"{API_URL}/edit_user", json=data, headers=headers)
+        response = http.put(f"{API_URL}/edit_user", json=data, headers=headers)
         if response.status_code == 200:
+            leaderboard_cache.invalidate()
             print(colored("User entry updated successfully", "green"))
         elif response.status_code == 403:
+            forget_api_key()
             print(colored("Unauthorized. Please enter a valid API Key", "red"))
         else:
             print(colored("Failed to update user entry", "red"))
-    except requests.exceptions.RequestException:
+    except HttpError:
         print(colored("Failed to connect to the leaderboard API", "red"))
 
-# Main function to run the trivia game
-def main():
-    global DEV_MODE, DIFFICULTY, CATEGORY, API_URL
 
+# Function to describe why the API rejected a request
+def error_reason(response):
+    if response.status_code == 403:
+        return "Unauthorized"
+    try:
+        return response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {response.status_code}"
+
+
+# Function to send every row of a CSV or JSON file to the leaderboard API.
+# Servers with a batch endpoint get the rows in batches, others get one
+# request per row with at most ADMIN_WORKERS requests in flight
+def send_rows(path, fields, method, endpoint, batch_endpoint, batch_field, headers=None):
+    from bulk import BatchUnsupported, read_rows, send_batches, send_concurrently
+
+    def send(row):
+        response = http.request(method, f"{API_URL}{endpoint}", json=row, headers=headers)
+        return None if response.status_code < 300 else error_reason(response)
+
+    def send_batch(rows):
+        response = http.request(
+            method, f"{API_URL}{batch_endpoint}", json={batch_field: rows}, headers=headers
+        )
+        if response.status_code in (404, 405):
+            raise BatchUnsupported()
+        if response.status_code != 200:
+            return [error_reason(response)] * len(rows)
+        return [
+            None if result["status"] < 300 else result.get("error", f"HTTP {result['status']}")
+            for result in response.json()["results"]
+        ]
+
+    try:
+        return send_batches(read_rows(path, fields), send_batch, ADMIN_BATCH_SIZE)
+    except BatchUnsupported:
+        return send_concurrently(read_rows(path, fields), send, ADMIN_WORKERS)
+
+
+# Function to print the failed rows and the throughput of a bulk operation
+def report_bulk(result, done):
+    lines = [colored(f"Row {row}: {reason}", "red") for row, reason in result.failures]
+    lines.append(
+        f"{result.sent} rows {done} in {result.elapsed:.2f}s "
+        f"({result.rate():.0f} rows/sec), {len(result.failures)} failed"
+    )
+    screen.write(lines)
+    if any(reason == "Unauthorized" for _, reason in result.failures):
+        forget_api_key()
+
+
+# Function to apply every edit in a file to the leaderboard database
+def edit_users_from_file(path):
+    if not leaderboard_circuit.allow():
+        print(colored(LEADERBOARD_DOWN, "red"))
+        return
+    from bulk import EDIT_FIELDS
+
+    headers = admin_headers()
+    try:
+        result = send_rows(path, EDIT_FIELDS, "PUT", "/edit_user", "/edit_users", "edits", headers)
+    except (OSError, ValueError) as e:
+        print(colored(f"Failed to read {path}: {e}", "red"))
+        return
+    leaderboard_cache.invalidate()
+    report_bulk(result, "updated")
+
+
+# Function to add every score in a file to the leaderboard database
+def import_leaderboard(path):
+    if not leaderboard_circuit.allow():
+        print(colored(LEADERBOARD_DOWN, "red"))
+        return
+    from bulk import SCORE_FIELDS
+
+    try:
+        result = send_rows(path, SCORE_FIELDS, "POST", "/add_score", "/add_scores", "scores")
+    except (OSError, ValueError) as e:
+        print(colored(f"Failed to read {path}: {e}", "red"))
+        return
+    leaderboard_cache.invalidate()
+    report_bulk(result, "imported")
+
+
+# Function to save the whole leaderboard to a file. The board is written as
+# it downloads, so it is never held in memory
+def export_leaderboard(path):
+    if not leaderboard_circuit.allow():
+        print(colored(LEADERBOARD_DOWN, "red"))
+        return
+    from bulk import SCORE_FIELDS, write_rows
+
+    start = time.perf_counter()
+    try:
+        response = http.get(f"{API_URL}/leaderboard", stream=True)
+        with response:
+            if response.status_code != 200:
+                print(colored("Failed to fetch leaderboard", "red"))
+                return
+            rows = iter_array(http.iter_content(response, LEADERBOARD_CHUNK_SIZE))
+            count = write_rows(path, rows, SCORE_FIELDS)
+    except HttpError:
+        print(colored("Failed to connect to the leaderboard API", "red"))
+        return
+    except (OSError, ValueError) as e:
+        print(colored(f"Failed to export the leaderboard: {e}", "red"))
+        return
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    print(
+        colored(
+            f"{count} rows exported to {path} in {elapsed:.2f}s ({rate:.0f} rows/sec)",
+            "green",
+        )
+    )
+
+
+# Command table, filled in by the @command decorator. Each entry is
+# (pattern words, handler, help lines, developer mode only)
+COMMANDS = []
+INVALID_COMMAND = "Invalid command. Type 'help' for a list of commands"
+
+
+# Decorator to register a REPL command. A pattern is made of literal words,
+# <name> for one word, [name] for an optional word and *name for the rest of
+# the line. Handlers are called with the username and the matched words, and
+# return True to leave the game. Commands are tried in the order they are
+# registered
+def command(pattern, *help, dev=False):
+    def register(handler):
+        COMMANDS.append((pattern.split(), handler, help, dev))
+        return handler
+
+    return register
+
+
+# Function to match the words of a command line against a pattern, returns
+# the handler arguments or None if it doesn't match
+def match_command(pattern, words):
+    args = []
+    for i, part in enumerate(pattern):
+        word = words[i] if i < len(words) else None
+        if part.startswith("*"):
+            args.append(words[i:])
+            return args
+        if part.startswith("["):
+            args.append(word)
+        elif part.startswith("<"):
+            if word is None:
+                return None
+            args.append(word)
+        elif part != word:
+            return None
+    return args if len(words) <= len(pattern) else None
+
+
+# Function to run one command line, returns True if the game should exit
+def dispatch(username, line):
+    words = line.split()
+    if not words:
+        return False
+    for pattern, handler, _, dev in COMMANDS:
+        args = match_command(pattern, words)
+        if args is None:
+            continue
+        if dev and not state.dev_mode:
+            break
+        with metrics.timer("command", " ".join(pattern)):
+            return handler(username, *args)
+    print(colored(INVALID_COMMAND, "red"))
+    return False
+
+
+# Function to get the lines showing a question and its options
+def question_lines(title, question):
+    lines = [f"{title}: {question.text}"]
+    lines += [f"{i}. {option}" for i, option in enumerate(question.options, 1)]
+    return lines
+
+
+# Function to get the lines showing the top of the leaderboard
+def high_score_lines():
+    lines = ["High Scores:"]
+    for data in get_high_scores(limit=HIGH_SCORE_ROWS):
+        lines.append(f"{data['username']}: {data['score']}")
+    return lines
+
+
+# Function to ask questions until one is answered incorrectly. Each question
+# is one frame with the leaderboard above it, so on a terminal only the
+# question and the scores that moved are redrawn
+def play_streak(username, next_question, mode):
+    screen.clear()
+    scores = high_score_lines()
+    while True:
+        question = next_question()
+        if not question:
+            break
+        lines = [*scores, "", *question_lines("Question", question)]
+        # The leaderboard is refreshed while the player thinks
+        refresh_high_scores()
+        start = time.perf_counter()
+        answer = screen.ask(lines, "Your answer: ", state.deadline)
+        correct = answer is not None and question.check(answer)
+        record_answer(username, question, correct, time.perf_counter() - start, mode)
+        lines.append(screen.rows[-1])
+        if correct:
+            update_score(username, 10)
+            lines.append(colored("Correct!", "green"))
+        elif answer is None:
+            lines.append(colored("Time's up!", "red"))
+            lines.append(f"Correct answer: {question.correct_answer}")
+        else:
+            lines.append(colored("Incorrect!", "red"))
+            lines.append(f"Correct answer: {question.correct_answer}")
+        scores = high_score_lines()
+        screen.draw(lines)
+        if not correct:
+            break
+
+
+@command("exit", "exit: Exit the game")
+def cmd_exit(username):
+    print(colored("Exiting...", "yellow"))
+    return True
+
+
+@command("help", "help: Show this help message")
+def cmd_help(username):
+    print("Commands:")
+    for _, _, help, _ in COMMANDS:
+        for line in help:
+            print(line)
+
+
+@command("about")
+def cmd_about(username):
+    print(colored("TuiTrivia: A trivia game for the terminal", "white", "on_blue"))
+    print("Note: When answering trivia questions, type the answer or its number.")
+
+
+@command("clear", "clear: Clear the screen")
+def cmd_clear(username):
+    print("\033c", end="")
+
+
+@command("scores", "scores <local|global>: Show high scores")
+def cmd_scores_usage(username):
+    print(colored("Usage scores <local|global>", "red"))
+
+
+@command("scores local")
+def cmd_scores_local(username):
+    rows = [
+        f"{user}: {data['score']} ({data['date']})" for user, data in load_scores().items()
+    ]
+    page(screen, "Scores:", rows)
+
+
+@command(
+    "scores global [count] [page]",
+    "scores global [count] [page]: Show a page of count global high scores",
+)
+def cmd_scores_global(username, count, number):
+    count = count or str(GLOBAL_SCORE_ROWS)
+    number = number or "1"
+    if not count.isdigit() or not number.isdigit() or int(count) < 1 or int(number) < 1:
+        print(colored("Count and page must be positive numbers", "red"))
+        return
+    count, number = int(count), int(number)
+    rows = [
+        f"{data['username']}: {data['score']} ({data['date']})"
+        for data in get_high_scores(limit=count, offset=(number - 1) * count)
+    ]
+    page(screen, f"High Scores (page {number}):", rows)
+
+
+@command("clearscore <username>", "clearscore <username>: Clear your score")
+def cmd_clearscore(username, target):
+    clear_score(target)
+
+
+@command("clearall", "clearall: Clear all scores")
+def cmd_clearall(username):
+    clear_all_scores()
+
+
+@command("cleardb", "cleardb: Clear the leaderboard database")
+def cmd_cleardb(username):
+    clear_leaderboard_db()
+
+
+@command(
+    "editdb <old_username> <new_username> <new_score> <new_date>",
+    "editdb <old_username> <new_username> <new_score> <new_date>: Edit a user entry in the leaderboard database",
+)
+def cmd_editdb(username, old_username, new_username, new_score, new_date):
+    try:
+        new_score = int(new_score)
+    except ValueError:
+        print(colored("Invalid score. Score must be an integer", "red"))
+        return
+    edit_user_db(old_username, new_username, new_score, new_date)
+
+
+@command(
+    "editdb --file <path>",
+    "editdb --file <path>: Apply the edits in a CSV or JSON file (old_username, new_username, new_score, new_date)",
+)
+def cmd_editdb_file(username, path):
+    edit_users_from_file(path)
+
+
+@command("exportdb <path>", "exportdb <path>: Save the leaderboard database to a CSV or JSON file")
+def cmd_exportdb(username, path):
+    export_leaderboard(path)
+
+
+@command(
+    "importdb <path>",
+    "importdb <path>: Add the scores in a CSV or JSON file to the leaderboard database (username, score, date)",
+)
+def cmd_importdb(username, path):
+    import_leaderboard(path)
+
+
+@command("trivia", "trivia: Get a random trivia question")
+def cmd_trivia(username):
+    play_streak(username, get_random_question, "trivia")
+
+
+@command(
+    "custom *filters",
+    "custom: Get a random custom trivia question",
+    "custom [difficulty] [tag]: Only use custom questions matching a difficulty and/or tag",
+)
+def cmd_custom(username, filters):
+    difficulty = None
+    tag = None
+    for word in filters:
+        if word.lower() in DIFFICULTY_LEVELS:
+            difficulty = word.lower()
+        else:
+            tag = word
+    play_streak(username, lambda: get_random_custom_question(difficulty, tag), "custom")
+
+
+@command(
+    "stats [player]",
+    "stats [username]: Show accuracy by category and difficulty, streaks and answer times",
+)
+def cmd_stats(username, player):
+    player = player or username
+    with metrics.timer("file", "events.stats"):
+        stats = event_log.stats(player)
+    if stats is None:
+        print(colored(f"No answers recorded for {player}", "yellow"))
+        return
+
+    def accuracy(answers, correct):
+        return f"{correct}/{answers} ({correct / answers:.0%})"
+
+    lines = [
+        colored(f"Stats for {player}", "cyan"),
+        f"Answers: {accuracy(stats['answers'], stats['correct'])} correct",
+        f"Longest streak: {stats['longest_streak']}, current streak: {stats['current_streak']}",
+        "Answer time: "
+        + ", ".join(f"p{percentile} {seconds:.1f}s" for percentile, seconds in stats["percentiles"]),
+        "",
+        "By category:",
+    ]
+    for category, answers, correct in stats["categories"]:
+        lines.append(f"  {category or 'Uncategorized'}: {accuracy(answers, correct)}")
+    lines += ["", "By difficulty:"]
+    for difficulty, answers, correct in stats["difficulties"]:
+        lines.append(f"  {difficulty or 'Unrated'}: {accuracy(answers, correct)}")
+    screen.write(lines)
+
+
+@command("addcustom", "addcustom: Add a custom trivia question")
+def cmd_addcustom(username):
+    add_custom_question()
+
+
+@command(
+    "importquestions <path>",
+    "importquestions <path>: Add the questions in an OpenTDB JSON, JSON lines or CSV file to the custom questions",
+)
+def cmd_importquestions(username, path):
+    import_custom_questions(path)
+
+
+@command("multiplayer", "multiplayer: Start a multiplayer game")
+def cmd_multiplayer(username):
+    players = input("Enter usernames of players (comma separated): ").split(",")
+    players = [Player(player.strip()) for player in players]
+    scores = {player.username: 0 for player in players}
+    screen.clear()
+    for i in range(10):
+        question = get_random_question()
+        if not question:
+            break
+        # The scoreboard stays at the top, only changed scores are redrawn
+        lines = ["Scores:", *(f"{player}: {score}" for player, score in scores.items())]
+        lines += ["", *question_lines(f"Question no. {i+1}", question)]
+
+        def ask(prompt):
+            answer = screen.ask(lines, prompt, state.deadline)
+            lines.append(screen.rows[-1])
+            return answer
+
+        results = []
+        for player in players:
+            player.getAnswer(ask)
+            correct = player.answer is not None and question.check(player.answer)
+            record_answer(player.username, question, correct, player.response_time, "multiplayer")
+            if correct:
+                results.append(colored(f"{player.username} answered correctly!", "green"))
+                scores[player.username] += 10
+            elif player.answer is None:
+                results.append(colored(f"{player.username} ran out of time!", "red"))
+            else:
+                results.append(colored(f"{player.username} answered incorrectly!", "red"))
+        screen.draw([*lines, *results, f"Correct answer: {question.correct_answer}"])
+    screen.draw(["Scores:", *(f"{player}: {score}" for player, score in scores.items())])
+
+
+@command("multiplayer host [port]", "multiplayer host [port]: Host a networked multiplayer game")
+def cmd_multiplayer_host(username, port):
+    if port is None:
+        host_multiplayer(username, MULTIPLAYER_PORT)
+    elif port.isdigit():
+        host_multiplayer(username, int(port))
+    else:
+        print(colored("Invalid port", "red"))
+
+
+@command(
+    "multiplayer join <address> [room]",
+    "multiplayer join <host[:port]> [room]: Join a networked multiplayer game",
+)
+def cmd_multiplayer_join(username, address, room):
+    host, _, port = address.partition(":")
+    if port and not port.isdigit():
+        print(colored("Invalid port", "red"))
+        return
+    join_multiplayer(
+        username, host, int(port) if port else MULTIPLAYER_PORT, room or "lobby"
+    )
+
+
+@command("devmode", "devmode: Enable/Disable developer mode")
+def cmd_devmode(username):
+    state.dev_mode = not state.dev_mode
+    print(colored(f"Developer mode {'enabled' if state.dev_mode else 'disabled'}", "yellow"))
+
+
+@command("difficulty", "difficulty <level>: Set difficulty level (easy, medium, hard)")
+def cmd_difficulty_show(username):
+    print("Current difficulty level:", state.difficulty)
+    print("Available difficulty levels:", ", ".join(DIFFICULTY_LEVELS))
+
+
+@command("difficulty <level>")
+def cmd_difficulty(username, level):
+    if level.lower() in DIFFICULTY_LEVELS:
+        state.difficulty = level.lower()
+        question_buffer.prefetch(state.difficulty, state.category)
+        print(colored(f"Difficulty level set to {level.lower()}", "green"))
+    else:
+        print(colored("Invalid difficulty level", "red"))
+
+
+@command("category", "category <name>: Set question category")
+def cmd_category_show(username):
+    print("Current category:", state.category)
+    print("Available categories:")
+    for name in CATEGORIES.keys():
+        print(f"{name}")
+
+
+@command("category <name>")
+def cmd_category(username, name):
+    if name in CATEGORIES:
+        state.category = name
+        question_buffer.prefetch(state.difficulty, state.category)
+        print(colored(f"Category set to {name}", "green"))
+    else:
+        print(colored("Invalid category", "red"))
+
+
+@command("deadline", "deadline <seconds|off>: Set the time to answer each question")
+def cmd_deadline_show(username):
+    if state.deadline is None:
+        print("No time limit for answers")
+    else:
+        print(f"Answers must be given within {state.deadline:g} seconds")
+
+
+@command("deadline <seconds>")
+def cmd_deadline(username, seconds):
+    if seconds.lower() == "off":
+        state.deadline = None
+        print(colored("Time limit for answers disabled", "green"))
+        return
+    try:
+        deadline = float(seconds)
+    except ValueError:
+        deadline = 0
+    if deadline > 0:
+        state.deadline = deadline
+        print(colored(f"Answers must be given within {deadline:g} seconds", "green"))
+    else:
+        print(colored("Invalid deadline. It must be a positive number of seconds", "red"))
+
+
+@command("offline", "offline: Enable/Disable offline mode")
+def cmd_offline(username):
+    state.offline = not state.offline
+    print(colored(f"Offline mode {'enabled' if state.offline else 'disabled'}", "yellow"))
+
+
+@command("sync", "sync: Show questions stored for offline mode")
+def cmd_sync_summary(username):
+    names = {category: name for name, category in CATEGORIES.items()}
+    print("Offline questions:")
+    for category, difficulty, size in question_store.summary():
+        print(f"{names.get(category, category)} ({difficulty}): {size}")
+
+
+@command("sync all", "sync <category|all>: Download a category for offline mode")
+def cmd_sync_all(username):
+    for name in CATEGORIES:
+        sync_category(name)
+
+
+@command("sync *words")
+def cmd_sync(username, words):
+    name = " ".join(words)
+    if name in CATEGORIES:
+        sync_category(name)
+    else:
+        print(colored("Invalid category", "red"))
+
+
+@command("debug", "debug: Show debug information", dev=True)
+def cmd_debug(username):
+    print("Scores:")
+    print(load_scores())
+    print("Users:")
+    print(load_users())
+    print("Custom Questions:")
+    print(load_custom_questions())
+
+
+@command("debug users", dev=True)
+def cmd_debug_users(username):
+    print(load_users())
+
+
+@command("debug custom", dev=True)
+def cmd_debug_custom(username):
+    print(load_custom_questions())
+
+
+@command("debug color <color>", "debug color <color>: Test colored output", dev=True)
+def cmd_debug_color(username, color):
+    try:
+        print(colored("This is a colored message", color))
+    except Exception as e:
+        print(colored(f"Error: {e}", "red"))
+
+
+@command("debug colors", "debug colors: Show available colors", dev=True)
+def cmd_debug_colors(username):
+    print("Colors:")
+    for color in ["grey", "red", "green", "yellow", "blue", "magenta", "cyan", "white"]:
+        print(colored(f"This is {color}", color))
+
+
+@command("debug edit <username> <score>", "debug edit <username> <score>: Edit a user's score", dev=True)
+def cmd_debug_edit(username, target, score):
+    try:
+        score = int(score)
+    except ValueError:
+        print(colored("Invalid score. Score must be an integer", "red"))
+        return
+    update_score(target, score)
+
+
+@command("debug api <url>", "debug api <url>: Set API URL", dev=True)
+def cmd_debug_api(username, url):
+    global API_URL
+    API_URL = url
+    leaderboard_cache.clear()
+    leaderboard_circuit.reset()
+    print(colored(f"Set URL to: {url}", "green"))
+
+
+@command("debug http", "debug http: Show API latency per endpoint", dev=True)
+def cmd_debug_http(username):
+    for _, endpoint, stats in metrics.summary("http"):
+        average = stats["total"] / stats["count"] * 1000
+        print(
+            f"{endpoint}: {stats['count']} calls, {stats['errors']} errors, "
+            f"avg {average:.1f}ms, p95 {stats['p95'] * 1000:.1f}ms, "
+            f"max {stats['max'] * 1000:.1f}ms"
+        )
+
+
+@command(
+    "debug stats",
+    "debug stats: Show latency histograms for commands, API calls and file access",
+    dev=True,
+)
+def cmd_debug_stats(username):
+    summaries = metrics.summary()
+    if not summaries:
+        print("No stats recorded yet")
+        return
+    print(
+        f"{'Kind':<8} {'Name':<40} {'Count':>6} {'Errors':>6} "
+        f"{'Avg':>9} {'p50':>9} {'p95':>9} {'Max':>9}"
+    )
+    for kind, name, stats in summaries:
+        times = [stats["total"] / stats["count"], stats["p50"], stats["p95"], stats["max"]]
+        print(
+            f"{kind:<8} {name:<40} {stats['count']:>6} {stats['errors']:>6} "
+            + " ".join(f"{t * 1000:>7.1f}ms" for t in times)
+        )
+
+
+@command("debug stats reset", "debug stats reset: Clear the recorded stats", dev=True)
+def cmd_debug_stats_reset(username):
+    metrics.reset()
+    print(colored("Stats cleared", "green"))
+
+
+@command(
+    "debug stats export <format> <path>",
+    "debug stats export <json|prometheus> <path>: Save the recorded stats to a file",
+    dev=True,
+)
+def cmd_debug_stats_export(username, output_format, path):
+    if output_format == "json":
+        text = metrics.to_json()
+    elif output_format == "prometheus":
+        text = metrics.to_prometheus()
+    else:
+        print(colored("Invalid format. Use json or prometheus", "red"))
+        return
+    try:
+        with open(path, "w") as file:
+            file.write(text)
+    except OSError as e:
+        print(colored(f"Failed to save stats: {e}", "red"))
+        return
+    print(colored(f"Stats saved to {path}", "green"))
+
+
+@command(
+    "debug timeout <connect> <read>",
+    "debug timeout <connect> <read>: Set API timeouts in seconds",
+    dev=True,
+)
+def cmd_debug_timeout(username, connect_timeout, read_timeout):
+    try:
+        http.set_timeouts(float(connect_timeout), float(read_timeout))
+        print(colored("Timeouts updated", "green"))
+    except ValueError:
+        print(colored("Invalid timeout. Timeouts must be numbers", "red"))
+
+
+@command(
+    "debug ttl <seconds>",
+    "debug ttl <seconds>: Set how long the leaderboard is cached",
+    dev=True,
+)
+def cmd_debug_ttl(username, seconds):
+    try:
+        leaderboard_cache.ttl = float(seconds)
+        print(colored(f"Leaderboard cached for {seconds} seconds", "green"))
+    except ValueError:
+        print(colored("Invalid TTL. TTL must be a number", "red"))
+
+
+# Function to get the REPL prompt, which shows when questions or scores are
+# local only
+def prompt(username):
+    modes = []
+    if state.offline:
+        modes.append("offline")
+    if not leaderboard_circuit.allow():
+        modes.append("local scores")
+    return f"{username} [{', '.join(modes)}]> " if modes else f"{username}> "
+
+
+# Function to welcome the player and log them in, returns the username
+def login():
     print(colored("Welcome to TuiTrivia!", "cyan"))
     while True:
         choice = input("Do you want to (1) Login or (2) Register? ")
         if choice == "1":
             username = authenticate_user()
             if username:
-                break
+                return username
         elif choice == "2":
             username = register_user()
             if username:
-                break
+                return username
         else:
             print(colored("Invalid choice. Please enter 1 or 2.", "red"))
 
+
+# Function to get the question sampler that remembers what a user has seen
+def new_sampler(username):
+    return QuestionSampler(SEEN_DIR, username, request_session_token, reset_session_token)
+
+
+# Function to run commands until the player exits
+def repl(username):
+    question_buffer.prefetch(state.difficulty, state.category)
     while True:
-        cmd = input(f"{username}> ")
-        match cmd.split():
-            case ["exit"]:
-                print(colored("Exiting...", "yellow"))
-                break
-            case ["help"]:
-                print("Commands:")
-                print("exit: Exit the game")
-                print("help: Show this help message")
-                print("clear: Clear the screen")
-                print("scores <local|global>: Show high scores")
-                print("clearscore <username>: Clear your score")
-                print("clearall: Clear all scores")
-                print("cleardb: Clear the leaderboard database")
-                print("editdb <old_username> <new_username> <new_score> <new_date>: Edit a user entry in the leaderboard database")
-                print("trivia: Get a random trivia question")
-                print("custom: Get a random custom trivia question")
-                print("addcustom: Add a custom trivia question")
-                print("edit <username> <score>: Edit a user's score")
-                print("multiplayer: Start a multiplayer game")
-                print("debug: Show debug information")
-                print("debug color <color>: Test colored output")
-                print("debug colors: Show available colors")
-                print("devmode: Enable/Disable developer mode")
-                print("difficulty <level>: Set difficulty level (easy, medium, hard)")
-                print("category <name>: Set question category")
-                print("debug api <url>: Set API URL")
-            case ["about"]:
-                print(
-                    colored(
-                        "TuiTrivia: A trivia game for the terminal", "white", "on_blue"
-                    )
-                )
-                print(
-                    "Note: When answering trivia questions, type the actual answer and not the number."
-                )
-            case ["devmode"]:
-                if DEV_MODE:
-                    DEV_MODE = False
-                    print(colored("Developer mode disabled", "yellow"))
-                else:
-                    DEV_MODE = True
-                    print(colored("Developer mode enabled", "yellow"))
-            case ["clear"]:
-                print("\033c", end="")
-            case ["scores"]:
-                print(colored("Usage scores <local|global>", "red"))
-            case ["scores", "local"]:
-                print("Scores:")
-                scores = load_scores()
-                for user, data in scores.items():
-                    print(f"{user}: {data['score']} ({data['date']})")
-            case ["scores", "global"]:
-                print("High Scores:")
-                for data in get_high_scores():
-                    print(f"{data['username']}: {data['score']} ({data['date']})")
-            case ["clearscore", username]:
-                clear_score(username)
-            case ["clearall"]:
-                clear_all_scores()
-            case ["cleardb"]:
-                clear_leaderboard_db()
-            case ["editdb", old_username, new_username, new_score, new_date]:
-                try:
-                    new_score = int(new_score)
-                    edit_user_db(old_username, new_username, new_score, new_date)
-                except ValueError:
-                    print(colored("Invalid score. Score must be an integer", "red"))
-            case ["trivia"]:
-                incorrect = False
-                while not incorrect:
-                    question = get_random_question()
-                    if question:
-                        print(f"Question: {question['question']}")
-                        for i, option in enumerate(
-                            question["incorrect_answers"]
-                            + [question["correct_answer"]],
-                            1,
-                        ):
-                            print(f"{i}. {option}")
-                        answer = input("Your answer: ")
-                        if answer == question["correct_answer"]:
-                            print(colored("Correct!", "green"))
-                            update_score(username, 10)
-                        else:
-                            print(colored("Incorrect!", "red"))
-                            print(f"Correct answer: {question['correct_answer']}")
-                            incorrect = True
-                    print("High Scores:")
-                    for data in get_high_scores():
-                        print(f"{data['username']}: {data['score']}")
-            case ["difficulty"]:
-                print("Current difficulty level:", DIFFICULTY)
-                print("Available difficulty levels:", ", ".join(DIFFICULTY_LEVELS))
-            case ["difficulty", level]:
-                if level.lower() in DIFFICULTY_LEVELS:
-                    DIFFICULTY = level.lower()
-                    print(colored(f"Difficulty level set to {level.lower()}", "green"))
-                else:
-                    print(colored("Invalid difficulty level", "red"))
-            case ["category"]:
-                print("Current category:", CATEGORY)
-                print("Available categories:")
-                for name in CATEGORIES.keys():
-                    print(f"{name}")
-            case ["category", name]:
-                if name in CATEGORIES:
-                    CATEGORY = name
-                    print(colored(f"Category set to {name}", "green"))
-                else:
-                    print(colored("Invalid category", "red"))
-            case ["custom"]:
-                incorrect = False
-                while not incorrect:
-                    question = get_random_custom_question()
-                    if question:
-                        print(f"Question: {question['question']}")
-                        for i, option in enumerate(
-                            question["incorrect_answers"]
-                            + [question["correct_answer"]],
-                            1,
-                        ):
-                            print(f"{i}. {option}")
-                        answer = input("Your answer: ")
-                        if answer == question["correct_answer"]:
-                            print(colored("Correct!", "green"))
-                            update_score(username, 10)
-                        else:
-                            print(colored("Incorrect!", "red"))
-                            print(f"Correct answer: {question['correct_answer']}")
-                            incorrect = True
-                    print("High Scores:")
-                    for data in get_high_scores():
-                        print(f"{data['username']}: {data['score']}")
-            case ["addcustom"]:
-                add_custom_question()
-            case ["multiplayer"]:
-                players = input("Enter usernames of players (comma separated): ").split(
-                    ","
-                )
-                players = [Player(player.strip()) for player in players]
-                scores = {player.username: 0 for player in players}
-                for i in range(10):
-                    question = get_random_question()
-                    if question:
-                        print(f"Question no. {i+1}: {question['question']}")
-                        for i, option in enumerate(
-                            question["incorrect_answers"]
-                            + [question["correct_answer"]],
-                            1,
-                        ):
-                            print(f"{i}. {option}")
-                        for player in players:
-                            player.getAnswer()
-                            if player.answer == question["correct_answer"]:
-                                print(
-                                    colored(
-                                        f"{player.username} answered correctly!",
-                                        "green",
-                                    )
-                                )
-                                scores[player.username] += 10
-                            else:
-                                print(
-                                    colored(
-                                        f"{player.username} answered incorrectly!",
-                                        "red",
-                                    )
-                                )
-                                incorrect = True
-                    print(f"Correct answer: {question['correct_answer']}")
-                    print("Scores:")
-                    for player, score in scores.items():
-                        print(f"{player}: {score}")
-            case ["debug"]:
-                if DEV_MODE:
-                    print("Scores:")
-                    print(load_scores())
-                    print("Users:")
-                    print(load_users())
-                    print("Custom Questions:")
-                    print(load_custom_questions())
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "users"]:
-                if DEV_MODE:
-                    print(load_users())
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "custom"]:
-                if DEV_MODE:
-                    print(load_custom_questions())
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "color", color]:
-                if DEV_MODE:
-                    try:
-                        print(colored("This is a colored message", color))
-                    except Exception as e:
-                        print(colored(f"Error: {e}", "red"))
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "colors"]:
-                if DEV_MODE:
-                    print("Colors:")
-                    for color in [
-                        "grey",
-                        "red",
-                        "green",
-                        "yellow",
-                        "blue",
-                        "magenta",
-                        "cyan",
-                        "white",
-                    ]:
-                        print(colored(f"This is {color}", color))
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "edit", username, score]:
-                if DEV_MODE:
-                    try:
-                        score = int(score)
-                        update_score(username, score)
-                    except ValueError:
-                        print(colored("Invalid score. Score must be an integer", "red"))
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case ["debug", "api", url]:
-                if DEV_MODE:
-                    if type(url) == str:
-                        API_URL = url
-                        print(colored(f"Set URL to: {url}", "green"))
-                    else:
-                        print(colored("Invalid URL", "red"))
-                else:
-                    print(
-                        colored(
-                            "Invalid command. Type 'help' for a list of commands", "red"
-                        )
-                    )
-            case [""]:
-                continue
-            case _:
-                print(
-                    colored(
-                        "Invalid command. Type 'help' for a list of commands", "red"
-                    )
-                )
+        if dispatch(username, read_line(prompt(username))):
+            break
+
+
+# Function to send queued scores, warning about any that could not be sent
+def flush_scores():
+    if score_outbox.flush():
+        print(
+            colored(
+                "Some scores could not be sent, they will be sent next time", "yellow"
+            )
+        )
+
+
+# Function to stop the background work once the game is over
+def shutdown():
+    leaderboard_circuit.stop()
+    score_outbox.stop()
+    flush_scores()
+
+
+# Main function to run the trivia game
+def main():
+
+    username = login()
+    state.sampler = new_sampler(username)
+    score_outbox.start()
+    repl(username)
+    shutdown()
+
+
+# Function to play the game non-interactively from a file of input lines,
+# one line per prompt. Passwords are read as plain lines
+def run_script(path):
+    global read_password
+    read_password = input
+    with open(path, "r") as script:
+        sys.stdin = script
+        try:
+            main()
+        except EOFError:
+            pass
+        finally:
+            sys.stdin = sys.__stdin__
+            read_password = read_hidden
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="TuiTrivia: A trivia game for the terminal")
+    parser.add_argument("--script", help="read input lines from this file instead of the terminal")
+    parser.add_argument("--api-url", help="leaderboard API URL")
+    parser.add_argument("--opentdb-url", help="Open Trivia Database URL")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=f"stay running in the background and serve sessions on {DAEMON_SOCKET}",
+    )
+    parser.add_argument(
+        "--no-daemon", action="store_true", help="play here even if a daemon is running"
+    )
+    args = parser.parse_args()
+    if args.api_url:
+        API_URL = args.api_url
+    if args.opentdb_url:
+        OPENTDB_URL = args.opentdb_url
     try:
-        main()
+        if args.daemon:
+            from daemon import serve
+
+            try:
+                serve(sys.modules[__name__], DAEMON_SOCKET)
+            except OSError as e:
+                print(colored(f"Failed to start the daemon: {e}", "red"))
+                sys.exit(1)
+        elif args.script:
+            run_script(args.script)
+        else:
+            # A running daemon already has everything loaded. Sessions with
+            # their own server URLs are played here
+            use_daemon = not (args.no_daemon or args.api_url or args.opentdb_url)
+            if use_daemon and os.path.exists(DAEMON_SOCKET):
+                from daemon import connect
+
+                if connect(DAEMON_SOCKET, read_hidden):
+                    sys.exit(0)
+            main()
     except KeyboardInterrupt:
         print(colored("\nExiting...", "yellow"))
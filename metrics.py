@@ -0,0 +1,144 @@
+# Latency histograms for TuiTrivia's hot paths
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds of the histogram buckets, in seconds. Anything slower goes in
+# a final overflow bucket
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+PROMETHEUS_PREFIX = "tuitrivia"
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, failed=False):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    # Estimate of the p-th percentile: the upper bound of the bucket it falls
+    # in, never more than the slowest observation
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = max(1, self.count * p / 100)
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total": self.total,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], self.counts)),
+        }
+
+
+# Histograms grouped by kind ("command", "http", "file") and name
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, kind, name, seconds, failed=False):
+        with self.lock:
+            histogram = self.histograms.get((kind, name))
+            if histogram is None:
+                histogram = self.histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, failed)
+
+    # Context manager timing a block, exceptions count as errors
+    @contextmanager
+    def timer(self, kind, name):
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.observe(kind, name, time.perf_counter() - start, failed)
+
+    # Decorator timing every call of a function
+    def timed(self, kind, name):
+        def decorate(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(kind, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    # Summaries of every histogram, or only those of one kind, sorted by
+    # kind and name
+    def summary(self, kind=None):
+        with self.lock:
+            return [
+                (histogram_kind, name, histogram.summary())
+                for (histogram_kind, name), histogram in sorted(self.histograms.items())
+                if kind is None or histogram_kind == kind
+            ]
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def to_json(self):
+        return json.dumps(
+            [
+                {"kind": kind, "name": name, **summary}
+                for kind, name, summary in self.summary()
+            ],
+            indent=4,
+        )
+
+    # Prometheus text exposition format, one histogram family per kind
+    def to_prometheus(self):
+        lines = []
+        families = {}
+        for kind, name, summary in self.summary():
+            families.setdefault(kind, []).append((name, summary))
+        for kind, entries in families.items():
+            metric = f"{PROMETHEUS_PREFIX}_{kind}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, summary in entries:
+                label = f'name="{escape_label(name)}"'
+                cumulative = 0
+                for bound, count in summary["buckets"].items():
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{label}}} {summary['total']}")
+                lines.append(f"{metric}_count{{{label}}} {summary['count']}")
+            errors = f"{PROMETHEUS_PREFIX}_{kind}_errors_total"
+            lines.append(f"# TYPE {errors} counter")
+            for name, summary in entries:
+                lines.append(f'{errors}{{name="{escape_label(name)}"}} {summary["errors"]}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
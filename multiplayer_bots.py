@@ -0,0 +1,150 @@
+# Headless bot players for load testing the TuiTrivia multiplayer server
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from multiplayer_server import DEFAULT_PORT, MultiplayerServer, synthetic_source
+
+
+# Function to get the p-th percentile of a list of numbers
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def bot(host, port, room, username, players, think_time, round_times):
+    reader, writer = await asyncio.open_connection(host, port)
+    join = {"type": "join", "room": room, "username": username}
+    writer.write((json.dumps(join) + "\n").encode())
+    # The first bot of each room starts the game and records its rounds
+    leader = round_times is not None
+    started = False
+    asked_at = None
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            match message["type"]:
+                case "players" if leader and not started:
+                    if len(message["players"]) >= players:
+                        writer.write(b'{"type": "start"}\n')
+                        started = True
+                case "question":
+                    asked_at = time.perf_counter()
+                    await asyncio.sleep(random.uniform(0, think_time))
+                    answer = {
+                        "type": "answer",
+                        "round": message["round"],
+                        "answer": random.choice(message["options"]),
+                    }
+                    writer.write((json.dumps(answer) + "\n").encode())
+                case "result" if leader:
+                    round_times.append(time.perf_counter() - asked_at)
+                case "game_over" | "error":
+                    break
+    finally:
+        writer.close()
+
+
+async def load_test(host, port, rooms, players, think_time, spawn_server, rounds, deadline):
+    if spawn_server:
+        server = MultiplayerServer(synthetic_source, rounds, deadline)
+        await server.start(host, port)
+    round_times = {f"room{i}": [] for i in range(rooms)}
+    bots = []
+    for room, times in round_times.items():
+        for i in range(players):
+            username = f"bot{i}"
+            leader_times = times if i == 0 else None
+            bots.append(bot(host, port, room, username, players, think_time, leader_times))
+    start = time.perf_counter()
+    await asyncio.gather(*bots)
+    elapsed = time.perf_counter() - start
+    if spawn_server:
+        server.server.close()
+    all_times = [t for times in round_times.values() for t in times]
+    return {
+        "rooms": rooms,
+        "players_per_room": players,
+        "rounds": len(all_times),
+        "elapsed": elapsed,
+        "rounds_per_second": len(all_times) / elapsed if elapsed else 0.0,
+        "round_time": {
+            "p50": percentile(all_times, 50),
+            "p95": percentile(all_times, 95),
+            "p99": percentile(all_times, 99),
+            "max": max(all_times, default=0.0),
+        },
+        "per_room": {
+            room: {
+                "rounds": len(times),
+                "p50": percentile(times, 50),
+                "p99": percentile(times, 99),
+            }
+            for room, times in round_times.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TuiTrivia multiplayer load tester")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--players", type=int, default=4, help="bots per room")
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0.05,
+        help="max seconds a bot waits before answering",
+    )
+    parser.add_argument(
+        "--spawn-server",
+        action="store_true",
+        help="run a server with synthetic questions in this process",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=10, help="rounds per game (with --spawn-server)"
+    )
+    parser.add_argument(
+        "--deadline", type=float, default=5, help="round deadline (with --spawn-server)"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = asyncio.run(
+        load_test(
+            args.host,
+            args.port,
+            args.rooms,
+            args.players,
+            args.think_time,
+            args.spawn_server,
+            args.rounds,
+            args.deadline,
+        )
+    )
+    print(f"{args.rooms * args.players} bots in {args.rooms} rooms")
+    print(
+        f"{results['rounds']} rounds in {results['elapsed']:.2f}s "
+        f"({results['rounds_per_second']:.1f} rounds/sec)"
+    )
+    times = results["round_time"]
+    print(
+        f"Round time p50 {times['p50'] * 1000:.1f}ms, p95 {times['p95'] * 1000:.1f}ms, "
+        f"p99 {times['p99'] * 1000:.1f}ms, max {times['max'] * 1000:.1f}ms"
+    )
+    slowest = sorted(results["per_room"].items(), key=lambda x: x[1]["p99"], reverse=True)[:5]
+    print("Slowest rooms:")
+    for room, stats in slowest:
+        print(f"{room}: p50 {stats['p50'] * 1000:.1f}ms, p99 {stats['p99'] * 1000:.1f}ms")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Terminal client for the TuiTrivia multiplayer server
+
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import threading
+
+from termcolor import colored
+
+from multiplayer_server import DEFAULT_PORT
+from render import Screen
+
+
+# Reads stdin lines without blocking the event loop, so server messages
+# keep arriving while the player is typing. Terminals are watched by the
+# event loop directly. Otherwise one line at a time is read on a thread,
+# and only when the game asks for it, so no input meant for the main
+# prompt is consumed after the game ends
+class StdinLines:
+    def __init__(self, loop):
+        self.loop = loop
+        self.lines = asyncio.Queue()
+        self.pending = b""
+        self.reading = False
+        self.watching = False
+        if sys.stdin.isatty():
+            try:
+                loop.add_reader(sys.stdin.fileno(), self._readable)
+                self.watching = True
+            except (NotImplementedError, ValueError, OSError):
+                pass
+
+    async def get(self):
+        if not self.watching and not self.reading:
+            self.reading = True
+            # In the caller's context, where sys.stdin may be a daemon session's
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._read_line,), daemon=True).start()
+        return await self.lines.get()
+
+    def close(self):
+        if self.watching:
+            self.loop.remove_reader(sys.stdin.fileno())
+
+    def _readable(self):
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            self.lines.put_nowait(None)
+            return
+        *lines, self.pending = (self.pending + data).split(b"\n")
+        for line in lines:
+            self.lines.put_nowait(line.decode().strip())
+
+    def _read_line(self):
+        line = sys.stdin.readline()
+        self.loop.call_soon_threadsafe(self._deliver, line.strip() if line else None)
+
+    def _deliver(self, line):
+        self.reading = False
+        self.lines.put_nowait(line)
+
+
+async def play(host, username, room, port=DEFAULT_PORT, screen=None):
+    reader, writer = await asyncio.open_connection(host, port)
+    join = {"type": "join", "room": room, "username": username}
+    writer.write((json.dumps(join) + "\n").encode())
+    lines = StdinLines(asyncio.get_running_loop())
+    state = {"question": None, "started": False, "asked": asyncio.Event()}
+    receiver = asyncio.create_task(receive(reader, state, screen or Screen()))
+    print(colored("Type 'start' to begin the game once everyone has joined", "yellow"))
+    try:
+        while not receiver.done():
+            if state["question"] is None and state["started"]:
+                # Only read the next line once there is a question to answer
+                waiter = asyncio.create_task(state["asked"].wait())
+                await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+            getter = asyncio.create_task(lines.get())
+            await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break
+            line = getter.result()
+            if line is None:
+                break
+            if line == "start" and state["question"] is None:
+                message = {"type": "start"}
+                state["started"] = True
+            else:
+                # An answer typed ahead of a question goes to the next one
+                waiter = asyncio.create_task(state["asked"].wait())
+                await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+                question = state["question"]
+                # Accept the option number as well as the answer text
+                answer = line
+                if line.isdigit() and 1 <= int(line) <= len(question["options"]):
+                    answer = question["options"][int(line) - 1]
+                message = {"type": "answer", "round": question["round"], "answer": answer}
+                state["question"] = None
+                state["asked"].clear()
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+    finally:
+        lines.close()
+        receiver.cancel()
+        writer.close()
+
+
+# Every message is printed with one write, so a question or a scoreboard
+# never arrives on screen a line at a time
+async def receive(reader, state, screen):
+    while line := await reader.readline():
+        message = json.loads(line)
+        match message["type"]:
+            case "joined":
+                screen.write(
+                    [colored(f"Joined room {message['room']} as {message['username']}", "green")]
+                )
+            case "players":
+                screen.write([f"Players: {', '.join(message['players'])}"])
+            case "question":
+                state["question"] = message
+                state["started"] = True
+                state["asked"].set()
+                screen.write(
+                    [
+                        f"Question no. {message['round']}/{message['rounds']}: {message['question']}",
+                        *(f"{i}. {option}" for i, option in enumerate(message["options"], 1)),
+                        f"You have {message['deadline']:g} seconds to answer",
+                    ]
+                )
+            case "result":
+                state["question"] = None
+                state["asked"].clear()
+                lines = [f"Correct answer: {message['correct_answer']}", "Scores:"]
+                for player, score in message["scores"].items():
+                    color = "green" if player in message["correct"] else "red"
+                    lines.append(colored(f"{player}: {score}", color))
+                screen.write(lines)
+            case "game_over":
+                screen.write([colored("Game over!", "cyan")])
+                return
+            case "error":
+                screen.write([colored(message["message"], "red")])
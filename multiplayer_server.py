@@ -0,0 +1,265 @@
+# Networked multiplayer server for TuiTrivia
+#
+# Players connect over TCP and exchange newline-delimited JSON messages.
+# Each room runs its own game: all questions are fetched before the first
+# round, and every round is answered by all players at once under a deadline.
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from question import Question
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5555
+ROUNDS = 10
+ROUND_DEADLINE = 20
+POINTS = 10
+TRIVIA_API_URL = "https://opentdb.com/api.php"
+
+
+# Question sources return `count` Question objects. They may block, the
+# server calls them from a worker thread
+def opentdb_source(count):
+    from http_client import HttpClient
+
+    response = HttpClient().get(
+        TRIVIA_API_URL, params={"amount": count, "type": "multiple"}
+    )
+    data = response.json()
+    if data.get("response_code") != 0:
+        raise RuntimeError("Failed to fetch questions")
+    return [Question.from_dict(question) for question in data["results"]]
+
+
+def store_source(count, path="questions.db"):
+    from question_store import QuestionStore
+
+    store = QuestionStore(path)
+    buckets = [(category, difficulty) for category, difficulty, _ in store.summary()]
+    if not buckets:
+        raise RuntimeError("The local question store is empty")
+    return [
+        Question.from_dict(store.random(*random.choice(buckets))) for _ in range(count)
+    ]
+
+
+def synthetic_source(count):
+    questions = []
+    for _ in range(count):
+        a, b = random.randint(1, 50), random.randint(1, 50)
+        answers = random.sample([str(n) for n in range(2, 101) if n != a + b], 3)
+        questions.append(Question(f"What is {a} + {b}?", str(a + b), answers))
+    return questions
+
+
+SOURCES = {
+    "opentdb": opentdb_source,
+    "store": store_source,
+    "synthetic": synthetic_source,
+}
+
+
+class Room:
+    def __init__(self, name):
+        self.name = name
+        self.players = {}
+        self.scores = {}
+        self.answers = {}
+        # perf_counter() when the current question was sent, and seconds
+        # each player took to answer it
+        self.asked_at = None
+        self.answer_times = {}
+        self.round = None
+        self.everyone_answered = asyncio.Event()
+        self.game = None
+
+
+class MultiplayerServer:
+    # on_answer(username, question, correct, seconds) is called for every
+    # answer given before the deadline, from the server's thread
+    def __init__(
+        self, source=opentdb_source, rounds=ROUNDS, deadline=ROUND_DEADLINE, on_answer=None
+    ):
+        self.source = source
+        self.on_answer = on_answer
+        self.rounds = rounds
+        self.deadline = deadline
+        self.rooms = {}
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    # Run the server on its own event loop in a background thread and
+    # return once it is listening
+    def start_in_thread(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        started = threading.Event()
+        errors = []
+
+        async def run():
+            try:
+                await self.start(host, port)
+            except OSError as e:
+                errors.append(e)
+                return
+            finally:
+                started.set()
+            await self.server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+        started.wait()
+        if errors:
+            raise errors[0]
+
+    async def handle_client(self, reader, writer):
+        room = None
+        username = None
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                match message.get("type"):
+                    case "join" if room is None:
+                        room, username = self.join(message, writer)
+                    case "start" if room is not None:
+                        self.start_game(room)
+                    case "answer" if room is not None:
+                        self.answer(room, username, message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if room is not None:
+                self.leave(room, username)
+            writer.close()
+
+    def join(self, message, writer):
+        name = str(message.get("room", "lobby"))
+        username = str(message.get("username", "player"))
+        room = self.rooms.setdefault(name, Room(name))
+        # Make duplicate usernames unique within the room
+        base, suffix = username, 2
+        while username in room.players:
+            username = f"{base}{suffix}"
+            suffix += 1
+        room.players[username] = writer
+        room.scores.setdefault(username, 0)
+        send(writer, {"type": "joined", "room": name, "username": username})
+        broadcast(room, {"type": "players", "players": list(room.players)})
+        return room, username
+
+    def leave(self, room, username):
+        room.players.pop(username, None)
+        if not room.players:
+            if room.game:
+                room.game.cancel()
+            self.rooms.pop(room.name, None)
+            return
+        broadcast(room, {"type": "players", "players": list(room.players)})
+        if room.round is not None and room.players.keys() <= room.answers.keys():
+            room.everyone_answered.set()
+
+    def start_game(self, room):
+        if room.game is None or room.game.done():
+            room.game = asyncio.create_task(self.run_game(room))
+
+    def answer(self, room, username, message):
+        if message.get("round") != room.round or username in room.answers:
+            return
+        room.answers[username] = str(message.get("answer", ""))
+        room.answer_times[username] = time.perf_counter() - room.asked_at
+        if room.players.keys() <= room.answers.keys():
+            room.everyone_answered.set()
+
+    async def run_game(self, room):
+        room.scores = {username: 0 for username in room.players}
+        try:
+            # Fetch every round up front so no round waits on the network
+            questions = await asyncio.to_thread(self.source, self.rounds)
+        except Exception as e:
+            broadcast(room, {"type": "error", "message": str(e)})
+            return
+        for number, question in enumerate(questions, 1):
+            room.answers = {}
+            room.answer_times = {}
+            room.asked_at = time.perf_counter()
+            room.round = number
+            room.everyone_answered.clear()
+            broadcast(
+                room,
+                {
+                    "type": "question",
+                    "round": number,
+                    "rounds": len(questions),
+                    "question": question.text,
+                    "options": question.options,
+                    "deadline": self.deadline,
+                },
+            )
+            try:
+                await asyncio.wait_for(room.everyone_answered.wait(), self.deadline)
+            except asyncio.TimeoutError:
+                pass
+            room.round = None
+            correct = [
+                username
+                for username, answer in room.answers.items()
+                if question.check(answer)
+            ]
+            for username in correct:
+                room.scores[username] = room.scores.get(username, 0) + POINTS
+            if self.on_answer:
+                for username, seconds in room.answer_times.items():
+                    self.on_answer(username, question, username in correct, seconds)
+            broadcast(
+                room,
+                {
+                    "type": "result",
+                    "round": number,
+                    "correct_answer": question.correct_answer,
+                    "correct": correct,
+                    "scores": room.scores,
+                },
+            )
+        broadcast(room, {"type": "game_over", "scores": room.scores})
+
+
+def send(writer, message):
+    writer.write((json.dumps(message) + "\n").encode())
+
+
+def broadcast(room, message):
+    data = (json.dumps(message) + "\n").encode()
+    for writer in room.players.values():
+        writer.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TuiTrivia multiplayer server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--source", choices=SOURCES, default="opentdb")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--deadline", type=float, default=ROUND_DEADLINE)
+    args = parser.parse_args()
+    server = MultiplayerServer(SOURCES[args.source], args.rounds, args.deadline)
+    print(f"Serving TuiTrivia multiplayer on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
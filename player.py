@@ -1,8 +1,16 @@
+import time
+
+
 class Player:
     def __init__(self, username):
         self.username = username
         self.score = 0
         self.answer = None
+        # Seconds taken to give the last answer
+        self.response_time = None
     
-    def getAnswer(self):
-        self.answer = input(f"{self.username}, what is your answer? ")
\ No newline at end of file
+    # ask(prompt) returns the answer, or None if the player ran out of time
+    def getAnswer(self, ask=input):
+        start = time.perf_counter()
+        self.answer = ask(f"{self.username}, what is your answer? ")
+        self.response_time = time.perf_counter() - start
\ No newline at end of file
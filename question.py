@@ -0,0 +1,98 @@
+# Trivia question model for TuiTrivia
+
+import html
+import random
+import sys
+
+from question_store import question_hash
+
+
+# Function to turn an answer into the key it is compared by: case, HTML
+# entities and runs of whitespace don't matter
+def answer_key(answer):
+    return " ".join(html.unescape(str(answer)).casefold().split())
+
+
+# Questions are built once, when they are fetched or read from a store.
+# Text is decoded from the HTML entities OpenTDB sends, the options are
+# shuffled once, and every accepted answer (the correct text and the
+# correct option number) is precomputed so checking an answer is a single
+# set lookup
+class Question:
+    __slots__ = (
+        "text",
+        "correct_answer",
+        "options",
+        "category",
+        "difficulty",
+        "tags",
+        "hash",
+        "accepted",
+    )
+
+    def __init__(
+        self,
+        text,
+        correct_answer,
+        incorrect_answers,
+        category="",
+        difficulty="",
+        tags=(),
+        hash=None,
+    ):
+        self.text = text
+        self.correct_answer = correct_answer
+        options = [*incorrect_answers, correct_answer]
+        random.shuffle(options)
+        self.options = tuple(options)
+        # Few distinct categories and difficulties, shared by every question
+        self.category = sys.intern(category)
+        self.difficulty = sys.intern(difficulty)
+        self.tags = tuple(tags)
+        # Seen-set key, matching the question store's deduplication hash
+        self.hash = hash or question_hash(
+            {"question": text, "correct_answer": correct_answer}
+        )
+        keys = {answer_key(option) for option in self.options}
+        accepted = {answer_key(correct_answer)}
+        number = str(self.options.index(correct_answer) + 1)
+        # An option number only counts if no option reads like that number
+        if number not in keys:
+            accepted.add(number)
+        self.accepted = frozenset(accepted)
+
+    # Build a question from an OpenTDB or custom question dict
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            html.unescape(data["question"]),
+            html.unescape(data["correct_answer"]),
+            [html.unescape(answer) for answer in data["incorrect_answers"]],
+            html.unescape(data.get("category", "")),
+            data.get("difficulty", ""),
+            data.get("tags", ()),
+            question_hash(data),
+        )
+
+    def to_dict(self):
+        data = {
+            "question": self.text,
+            "correct_answer": self.correct_answer,
+            "incorrect_answers": [
+                option for option in self.options if option != self.correct_answer
+            ],
+        }
+        if self.category:
+            data["category"] = self.category
+        if self.difficulty:
+            data["difficulty"] = self.difficulty
+        if self.tags:
+            data["tags"] = list(self.tags)
+        return data
+
+    # True if the answer is the correct option's text or number
+    def check(self, answer):
+        return answer_key(answer) in self.accepted
+
+    def __repr__(self):
+        return f"Question({self.text!r}, {self.correct_answer!r})"
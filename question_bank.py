@@ -0,0 +1,188 @@
+# Custom question bank for TuiTrivia
+
+import json
+import mmap
+import os
+import random
+from array import array
+from bisect import bisect_left
+from hashlib import sha256
+
+from file_lock import locked
+
+OFFSET_SIZE = array("q").itemsize
+
+
+# Questions are appended to a JSON lines file and never rewritten. Index
+# files hold fixed-width 8-byte entries: the main index maps record numbers
+# to byte offsets, and one index per difficulty and per tag lists the
+# matching record numbers. A random pick reads one index entry and one
+# record, so the cost does not depend on the size of the bank
+class QuestionBank:
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.index_dir = f"{path}.index"
+        self.lock_path = f"{path}.lock"
+        self.ready = False
+
+    # Add a question and return its record number
+    def add(self, question):
+        self._prepare()
+        with locked(self.lock_path):
+            return self._append([question])[0]
+
+    # Add many questions under a single lock
+    def add_many(self, questions):
+        self._prepare()
+        with locked(self.lock_path):
+            return self._append(questions)
+
+    # Number of questions, optionally only those matching a filter
+    def count(self, difficulty=None, tag=None):
+        self._prepare()
+        return self._size(self._index_path(difficulty, tag))
+
+    # Function to pick a random question, or None if nothing matches
+    def random(self, difficulty=None, tag=None):
+        self._prepare()
+        if difficulty and tag:
+            records = self._matching(
+                self._index_path(difficulty=difficulty), self._index_path(tag=tag)
+            )
+            if not records:
+                return None
+            return self._read_record(random.choice(records))
+        return self._random_from(self._index_path(difficulty, tag))
+
+    # Iterate over every question in insertion order
+    def __iter__(self):
+        return self.since(0)
+
+    # Iterate over the questions from a record number on, in insertion order
+    def since(self, record):
+        self._prepare()
+        if not os.path.exists(self.path) or record >= self.count():
+            return
+        with open(self.path, "rb") as file:
+            if record:
+                file.seek(self._read_entry(self._index_path(), record))
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _prepare(self):
+        if self.ready:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._migrate()
+        self.ready = True
+
+    # Move questions from the old single JSON array file into the bank once
+    def _migrate(self):
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with locked(self.lock_path):
+            if not os.path.exists(self.legacy_path):
+                return
+            with open(self.legacy_path, "r") as file:
+                self._append(json.load(file))
+            os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+
+    def _index_path(self, difficulty=None, tag=None):
+        if tag:
+            name = "tag-" + sha256(tag.lower().encode()).hexdigest()[:16]
+        elif difficulty:
+            name = f"difficulty-{difficulty}"
+        else:
+            name = "all"
+        return os.path.join(self.index_dir, name + ".idx")
+
+    def _size(self, path):
+        try:
+            return os.path.getsize(path) // OFFSET_SIZE
+        except FileNotFoundError:
+            return 0
+
+    def _read_entry(self, path, position):
+        with open(path, "rb") as file:
+            file.seek(position * OFFSET_SIZE)
+            entry = array("q")
+            entry.frombytes(file.read(OFFSET_SIZE))
+            return entry[0]
+
+    def _random_from(self, path):
+        size = self._size(path)
+        if not size:
+            return None
+        record = self._read_entry(path, random.randrange(size))
+        if path == self._index_path():
+            return self._read_offset(record)
+        return self._read_record(record)
+
+    def _read_record(self, record):
+        return self._read_offset(self._read_entry(self._index_path(), record))
+
+    def _read_offset(self, offset):
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.readline())
+
+    # Record numbers found in both filter indexes. Record numbers are
+    # appended in increasing order, so every entry of the smaller index is
+    # looked up in the larger one with a binary search over a memory map
+    def _matching(self, *paths):
+        small, large = sorted(paths, key=self._size)
+        size = self._size(small) * OFFSET_SIZE
+        if not size:
+            return []
+        with open(small, "rb") as file:
+            records = array("q")
+            records.frombytes(file.read(size))
+        with open(large, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                entries = memoryview(data)[: self._size(large) * OFFSET_SIZE].cast("q")
+                matches = []
+                for record in dict.fromkeys(records):
+                    position = bisect_left(entries, record)
+                    if position < len(entries) and entries[position] == record:
+                        matches.append(record)
+                entries.release()
+        return matches
+
+    # Must be called with the lock held
+    def _append(self, questions):
+        main_index = self._index_path()
+        records = self._size(main_index)
+        offsets = array("q")
+        filters = {}
+        with open(self.path, "a+b") as file:
+            offset = file.tell()
+            if offset:
+                file.seek(offset - 1)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+                    offset += 1
+            for question in questions:
+                line = (json.dumps(question) + "\n").encode()
+                file.write(line)
+                record = records + len(offsets)
+                offsets.append(offset)
+                offset += len(line)
+                paths = []
+                if question.get("difficulty"):
+                    paths.append(self._index_path(difficulty=question["difficulty"]))
+                for tag in question.get("tags", []):
+                    paths.append(self._index_path(tag=tag))
+                for path in paths:
+                    filters.setdefault(path, array("q")).append(record)
+        # Records become visible through the main index first, so a filter
+        # index never points past its end. A crash can leave a partial entry
+        # behind, so it is dropped before appending
+        for path, entries in [(main_index, offsets)] + list(filters.items()):
+            with open(path, "ab") as file:
+                file.truncate(self._size(path) * OFFSET_SIZE)
+                entries.tofile(file)
+        return list(range(records, records + len(offsets)))
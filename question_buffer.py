@@ -0,0 +1,115 @@
+# Prefetching question buffer for TuiTrivia
+
+import contextvars
+import threading
+import time
+from collections import deque
+
+# OpenTDB allows at most 50 questions per request
+BATCH_SIZE = 50
+# Start refilling a buffer once it holds this many questions or fewer
+LOW_WATER_MARK = 10
+# OpenTDB rate limits each IP to one request every 5 seconds
+REQUEST_INTERVAL = 5
+MAX_ATTEMPTS = 3
+
+# OpenTDB response codes
+RESPONSE_OK = 0
+RESPONSE_NO_RESULTS = 1
+RESPONSE_RATE_LIMIT = 5
+
+
+class QuestionBuffer:
+    def __init__(
+        self,
+        fetch,
+        batch_size=BATCH_SIZE,
+        low_water_mark=LOW_WATER_MARK,
+        request_interval=REQUEST_INTERVAL,
+    ):
+        # fetch(amount, difficulty, category) returns the decoded OpenTDB
+        # response, or None if the request failed
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.low_water_mark = low_water_mark
+        self.request_interval = request_interval
+        self.buffers = {}
+        self.refilling = set()
+        self.last_request = 0.0
+        self.lock = threading.Lock()
+        self.filled = threading.Condition(self.lock)
+        self.request_lock = threading.Lock()
+
+    # Start filling the buffer for a difficulty/category pair ahead of time
+    def prefetch(self, difficulty, category):
+        with self.lock:
+            self._refill_if_low((difficulty, category))
+
+    # Pop a question for a difficulty/category pair. When the buffer is
+    # completely empty this waits for the background refill, unless wait
+    # is False
+    def get(self, difficulty, category, wait=True):
+        key = (difficulty, category)
+        with self.lock:
+            self._refill_if_low(key)
+            buffer = self.buffers[key]
+            while wait and not buffer and key in self.refilling:
+                self.filled.wait()
+            if not buffer:
+                return None
+            question = buffer.popleft()
+            self._refill_if_low(key)
+            return question
+
+    # Drop every buffered question, e.g. after the API URL changed
+    def clear(self):
+        with self.lock:
+            for buffer in self.buffers.values():
+                buffer.clear()
+
+    def _refill_if_low(self, key):
+        buffer = self.buffers.setdefault(key, deque())
+        if len(buffer) <= self.low_water_mark and key not in self.refilling:
+            self.refilling.add(key)
+            # The refill runs in the context of the caller, so fetch sees
+            # their session, like a daemon session's OpenTDB token
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(self._refill, key), daemon=True).start()
+
+    def _refill(self, key):
+        difficulty, category = key
+        amount = self.batch_size
+        results = []
+        try:
+            attempts = 0
+            while attempts < MAX_ATTEMPTS:
+                data = self.request(amount, difficulty, category)
+                if not data:
+                    break
+                code = data.get("response_code")
+                if code == RESPONSE_OK:
+                    results = data["results"]
+                    break
+                if code == RESPONSE_NO_RESULTS and amount > 1:
+                    # Not enough questions left for this filter, ask for fewer
+                    amount //= 2
+                elif code == RESPONSE_RATE_LIMIT:
+                    attempts += 1
+                else:
+                    break
+        finally:
+            with self.lock:
+                self.buffers[key].extend(results)
+                self.refilling.discard(key)
+                self.filled.notify_all()
+
+    # Send one request, spacing requests out to respect the rate limit
+    def request(self, *args, **kwargs):
+        with self.request_lock:
+            wait = self.last_request + self.request_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return self.fetch(*args, **kwargs)
+            finally:
+                self.last_request = time.monotonic()
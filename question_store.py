@@ -0,0 +1,117 @@
+# Local question corpus for TuiTrivia, backed by SQLite
+
+import json
+import random
+import threading
+from hashlib import sha256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    hash TEXT PRIMARY KEY,
+    category INTEGER NOT NULL,
+    difficulty TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS questions_bucket
+    ON questions (category, difficulty, slot);
+CREATE TABLE IF NOT EXISTS buckets (
+    category INTEGER NOT NULL,
+    difficulty TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (category, difficulty)
+);
+"""
+
+
+# Function to hash a question for deduplication
+def question_hash(question):
+    key = f"{question['question']}\0{question['correct_answer']}"
+    return sha256(key.encode()).hexdigest()
+
+
+class QuestionStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.lock = threading.Lock()
+
+    # The database is opened on first use so startup never touches the disk,
+    # and sqlite3 is only imported then
+    def _connect(self):
+        if self.db is None:
+            import sqlite3
+
+            self.db = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            self.db.executescript(SCHEMA)
+        return self.db
+
+    # Cache OpenTDB results for a category, skipping questions already stored.
+    # Every question in a (category, difficulty) bucket gets a dense slot
+    # number so a random pick is a single index lookup
+    def add(self, questions, category):
+        added = 0
+        with self.lock:
+            db = self._connect()
+            # Take the write lock up front so concurrent processes never
+            # hand out the same slot twice
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for question in questions:
+                    difficulty = question.get("difficulty", "")
+                    row = db.execute(
+                        "SELECT size FROM buckets WHERE category = ? AND difficulty = ?",
+                        (category, difficulty),
+                    ).fetchone()
+                    size = row[0] if row else 0
+                    cursor = db.execute(
+                        "INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?, ?)",
+                        (
+                            question_hash(question),
+                            category,
+                            difficulty,
+                            size,
+                            json.dumps(question),
+                        ),
+                    )
+                    if cursor.rowcount:
+                        db.execute(
+                            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                            (category, difficulty, size + 1),
+                        )
+                        added += 1
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return added
+
+    # Number of stored questions for a category and difficulty
+    def count(self, category, difficulty):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT size FROM buckets WHERE category = ? AND difficulty = ?",
+                (category, difficulty),
+            ).fetchone()
+        return row[0] if row else 0
+
+    # Function to pick a random stored question, or None if the bucket is empty
+    def random(self, category, difficulty):
+        size = self.count(category, difficulty)
+        if not size:
+            return None
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM questions WHERE category = ? AND difficulty = ? AND slot = ?",
+                (category, difficulty, random.randrange(size)),
+            ).fetchone()
+        return json.loads(row[0])
+
+    # Stored question counts per (category, difficulty)
+    def summary(self):
+        with self.lock:
+            return self._connect().execute(
+                "SELECT category, difficulty, size FROM buckets ORDER BY category, difficulty"
+            ).fetchall()
@@ -0,0 +1,141 @@
+# Ranked score index for TuiTrivia
+
+import random
+
+MAX_LEVEL = 32
+P = 0.25
+
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+# Skip list ordered by (-score, username) where every link also stores how
+# many entries it skips, so updates, rank lookups and top-N pages all take
+# O(log n) instead of a full sort
+class Ranking:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.head = _Node(None, MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+        self.keys = {}
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, username):
+        return username in self.keys
+
+    # Insert or move a user to their new score
+    def set(self, username, score):
+        if username in self.keys:
+            self._delete(self.keys[username])
+        key = (-score, username)
+        self._insert(key)
+        self.keys[username] = key
+
+    def remove(self, username):
+        key = self.keys.pop(username, None)
+        if key is not None:
+            self._delete(key)
+
+    def score(self, username):
+        key = self.keys.get(username)
+        return -key[0] if key else None
+
+    # 1-based position of a user, or None if they have no score
+    def rank(self, username):
+        key = self.keys.get(username)
+        if key is None:
+            return None
+        rank = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+            if node.key == key:
+                return rank
+        return None
+
+    # (username, score) pairs for the given page, best first
+    def top(self, count=None, offset=0):
+        node = self._node_at(offset)
+        results = []
+        while node is not None and (count is None or len(results) < count):
+            results.append((node.key[1], -node.key[0]))
+            node = node.forward[0]
+        return results
+
+    # First node at or after the 0-based position
+    def _node_at(self, offset):
+        if offset <= 0:
+            return self.head.forward[0]
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= offset:
+                traversed += node.span[i]
+                node = node.forward[i]
+        return node.forward[0]
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < P:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        update = [None] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+        node = _Node(key, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+
+    def _delete(self, key):
+        update = [None] * MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        node = node.forward[0]
+        if node is None or node.key != key:
+            return
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
@@ -0,0 +1,181 @@
+# Terminal rendering for TuiTrivia
+#
+# A screen is drawn as whole frames, each written with a single buffered
+# write. On a terminal the frame is remembered row by row, and drawing the
+# next one only rewrites the rows that changed. A frame taller than the
+# terminal is cut from the top. Anywhere else (pipes, files, scripts)
+# frames are printed as plain lines, and a frame that only adds lines below
+# the last one prints just those lines.
+
+import math
+import os
+import re
+import shutil
+import sys
+
+from input_loop import read_line
+
+ESCAPE = re.compile(r"\033\[[0-9;?]*[A-Za-z]")
+CLEAR_SCREEN = "\033[H\033[2J"
+CLEAR_LINE = "\033[K"
+
+
+# Function to get the length of a line as displayed, ignoring color codes
+def visible_length(line):
+    return len(ESCAPE.sub("", line))
+
+
+# Function to cut a line to a number of displayed characters, keeping its
+# color codes intact
+def fit(line, width):
+    if visible_length(line) <= width:
+        return line
+    parts = []
+    shown = 0
+    position = 0
+    for match in ESCAPE.finditer(line):
+        text = line[position : match.start()][: width - shown]
+        parts.append(text)
+        shown += len(text)
+        parts.append(match.group())
+        position = match.end()
+    parts.append(line[position:][: width - shown])
+    return "".join(parts)
+
+
+class Screen:
+    def __init__(self, stream=None, tty=None):
+        self._stream = stream
+        self._tty = tty
+        # What is currently displayed on each row of the frame
+        self.rows = []
+
+    # Without a stream of its own the screen follows sys.stdout, so it
+    # respects redirection
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    @property
+    def tty(self):
+        if self._tty is not None:
+            return self._tty
+        return self.stream.isatty() and os.environ.get("TERM") != "dumb"
+
+    # Terminal size as (columns, lines)
+    def size(self):
+        return shutil.get_terminal_size()
+
+    # Rows a frame can have without scrolling the terminal
+    def height(self):
+        return max(1, self.size().lines - 1)
+
+    # Start a new frame at the top of a cleared screen
+    def clear(self):
+        if self.tty:
+            self._write(CLEAR_SCREEN)
+        self.rows = []
+
+    # Replace the frame with these lines
+    def draw(self, lines):
+        self._write(self._frame([str(line) for line in lines]))
+
+    # Draw the lines with a prompt below them and read an answer on the
+    # prompt's row. With a timeout in seconds a countdown is shown above the
+    # prompt, and None is returned if the time runs out
+    def ask(self, lines, prompt, timeout=None):
+        lines = [str(line) for line in lines]
+        timer = [] if timeout is None else [countdown(timeout)]
+        if not self.tty:
+            self.draw(lines)
+            # The countdown can't be redrawn here. It is printed once, like a
+            # log line, and not kept in the frame, so the next frame still
+            # only prints what it adds
+            self._write("".join(f"{line}\n" for line in timer))
+            answer = read_line(prompt, timeout)
+            self.rows.append(prompt + (answer or ""))
+            return answer
+        frame = self._frame(last(lines, self.height() - 1 - len(timer)) + timer + [prompt])
+        # Leave the cursor at the end of the prompt instead of below it
+        row = len(self.rows)
+        column = min(visible_length(self.rows[-1]), self.size().columns - 1) + 1
+        self._write(f"{frame}\033[{row};{column}H")
+
+        # Redraw the countdown row while keeping the cursor where the
+        # player is typing
+        def tick(left):
+            line = fit(countdown(left), self.size().columns)
+            if row > 1 and line != self.rows[-2]:
+                self.rows[-2] = line
+                self._write(f"\0337\033[{row - 1};1H{line}{CLEAR_LINE}\0338")
+
+        answer = read_line("", timeout, tick)
+        self.rows[-1] = fit(prompt + (answer or ""), self.size().columns)
+        return answer
+
+    # Print lines below the frame without tracking them, for output that
+    # scrolls like a log
+    def write(self, lines):
+        self._write("".join(f"{line}\n" for line in lines))
+        self.rows = []
+
+    def _frame(self, lines):
+        if not self.tty:
+            # Only what was added below the last frame is printed again
+            start = len(self.rows) if lines[: len(self.rows)] == self.rows else 0
+            self.rows = lines
+            return "".join(f"{line}\n" for line in lines[start:])
+        columns, _ = self.size()
+        lines = [fit(line, columns) for line in last(lines, self.height())]
+        parts = []
+        for row, line in enumerate(lines):
+            if row >= len(self.rows) or self.rows[row] != line:
+                parts.append(f"\033[{row + 1};1H{line}{CLEAR_LINE}")
+        for row in range(len(lines), len(self.rows)):
+            parts.append(f"\033[{row + 1};1H{CLEAR_LINE}")
+        parts.append(f"\033[{len(lines) + 1};1H")
+        self.rows = lines
+        return "".join(parts)
+
+    def _write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+
+# Function to get the last rows of a frame that fit in a number of rows. A
+# frame too tall for the terminal loses its top rows, so the question and
+# its options, which come last, stay visible
+def last(lines, count):
+    return lines[max(0, len(lines) - max(0, count)) :]
+
+
+# Function to get the countdown line shown above a timed prompt
+def countdown(seconds):
+    return f"Time left: {math.ceil(seconds)}s"
+
+
+# Show a long list of rows one screen at a time. On a terminal the player
+# pages with n/p and leaves with q. Short lists, and every list anywhere
+# else, are printed at once
+def page(screen, title, rows):
+    size = max(1, screen.height() - 2)
+    if not screen.tty or len(rows) <= size:
+        screen.write([title, *rows])
+        return
+    pages = max(1, -(-len(rows) // size))
+    number = 0
+    screen.clear()
+    while True:
+        start = number * size
+        lines = [title, *rows[start : start + size]]
+        lines += [""] * (size + 1 - len(lines))
+        choice = screen.ask(
+            lines, f"Page {number + 1}/{pages} - [n]ext, [p]revious, [q]uit: "
+        ).strip().lower()
+        if choice in ("n", "") and number + 1 < pages:
+            number += 1
+        elif choice == "p" and number > 0:
+            number -= 1
+        elif choice == "q" or (choice == "" and number + 1 == pages):
+            break
+    screen.clear()
@@ -0,0 +1,161 @@
+# Non-repeating question sampling for TuiTrivia
+
+import os
+import threading
+from hashlib import sha256
+
+
+# 2^17 bits (16 KiB) per bucket holds about 13,000 questions at a 1% false
+# positive rate
+BLOOM_BITS = 1 << 17
+BLOOM_HASHES = 7
+BLOOM_CAPACITY = 13000
+# Consecutive already-seen draws before a bucket counts as exhausted
+MAX_SAMPLE_ATTEMPTS = 20
+COUNT_SIZE = 4
+
+
+class BloomFilter:
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES, data=None, count=0):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data else bytearray(bits // 8)
+        self.count = count
+
+    def _positions(self, key):
+        digest = sha256(key.encode()).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.data[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def add(self, key):
+        for bit in self._positions(key):
+            self.data[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def clear(self):
+        self.data = bytearray(self.bits // 8)
+        self.count = 0
+
+    def to_bytes(self):
+        return self.count.to_bytes(COUNT_SIZE, "little") + bytes(self.data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) != COUNT_SIZE + BLOOM_BITS // 8:
+            raise ValueError("Invalid Bloom filter size")
+        return cls(data=data[COUNT_SIZE:], count=int.from_bytes(data[:COUNT_SIZE], "little"))
+
+
+# Remembers which questions a user has already been served, one fixed-size
+# Bloom filter per bucket (a category/difficulty pair or the custom bank),
+# and holds the user's OpenTDB session token so the API itself avoids
+# sending repeats
+class QuestionSampler:
+    def __init__(self, path, username, request_token, reset_token):
+        # request_token() returns a new token or None, reset_token(token)
+        # returns True if the API forgot what the token has served
+        self.path = os.path.join(path, sha256(username.encode()).hexdigest()[:16])
+        self.request_token = request_token
+        self.reset_token = reset_token
+        self.filters = {}
+        self.token = None
+        self.lock = threading.Lock()
+        self.token_lock = threading.Lock()
+
+    # The current session token, requesting one if needed
+    def session_token(self):
+        with self.token_lock:
+            if self.token is None:
+                self.token = self._read_token() or self.request_token()
+                self._write_token()
+            return self.token
+
+    # The API no longer knows our token (it expires after 6 hours idle)
+    def token_expired(self):
+        with self.token_lock:
+            self.token = self.request_token()
+            self._write_token()
+
+    # The token has served every question for a bucket, start it over
+    def token_exhausted(self, bucket):
+        with self.token_lock:
+            if self.token is None or not self.reset_token(self.token):
+                self.token = self.request_token()
+                self._write_token()
+        with self.lock:
+            self._filter(bucket).clear()
+            self._save(bucket)
+
+    # Return the question if the user has not seen it yet, otherwise None
+    def unseen(self, bucket, question):
+        if question is None:
+            return None
+        with self.lock:
+            if question.hash in self._filter(bucket):
+                return None
+        return question
+
+    # Draw questions until one the user has not seen comes up. When a whole
+    # run of draws was already seen the bucket is treated as exhausted and
+    # its seen-set is reset
+    def pick(self, bucket, draw):
+        question = None
+        for _ in range(MAX_SAMPLE_ATTEMPTS):
+            question = draw()
+            if question is None:
+                return None
+            with self.lock:
+                seen = self._filter(bucket)
+                key = question.hash
+                if key not in seen:
+                    self._mark(bucket, seen, key)
+                    return question
+        with self.lock:
+            seen = self._filter(bucket)
+            seen.clear()
+            self._mark(bucket, seen, question.hash)
+        return question
+
+    def _mark(self, bucket, seen, key):
+        if seen.count >= BLOOM_CAPACITY:
+            # Keep the false positive rate bounded
+            seen.clear()
+        seen.add(key)
+        self._save(bucket)
+
+    def _file(self, bucket):
+        return os.path.join(self.path, f"{bucket}.bloom")
+
+    def _filter(self, bucket):
+        if bucket not in self.filters:
+            try:
+                with open(self._file(bucket), "rb") as file:
+                    self.filters[bucket] = BloomFilter.from_bytes(file.read())
+            except (OSError, ValueError):
+                self.filters[bucket] = BloomFilter()
+        return self.filters[bucket]
+
+    def _save(self, bucket):
+        os.makedirs(self.path, exist_ok=True)
+        path = self._file(bucket)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as file:
+            file.write(self.filters[bucket].to_bytes())
+        os.replace(temp, path)
+
+    def _read_token(self):
+        try:
+            with open(os.path.join(self.path, "token"), "r") as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_token(self):
+        if self.token:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, "token"), "w") as file:
+                file.write(self.token)
@@ -0,0 +1,174 @@
+# Crash-safe local score store for TuiTrivia
+
+import json
+import os
+import threading
+
+from file_lock import locked
+from ranking import Ranking
+
+# Fold the journal into the snapshot once it holds this many updates
+COMPACT_THRESHOLD = 1000
+
+
+# Scores live in a snapshot file (the old scores.json format, written in
+# rank order) plus an append-only journal of absolute per-user updates.
+# Every process replays journal entries it has not seen yet before reading
+# or writing, and writers hold an exclusive file lock while appending
+class ScoreStore:
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.lock_path = f"{path}.lock"
+        self.compact_threshold = compact_threshold
+        self.scores = {}
+        self.ranking = Ranking()
+        self.snapshot_id = None
+        self.journal_offset = 0
+        self.journal_entries = 0
+        # The daemon's sessions use the store from several threads
+        self.lock = threading.Lock()
+
+    def get(self, username):
+        with self.lock, locked(self.lock_path, exclusive=False):
+            self._refresh()
+            entry = self.scores.get(username)
+            return dict(entry) if entry else None
+
+    # All scores as {username: {'score', 'date'}}, best first
+    def all(self):
+        return {
+            entry["username"]: {"score": entry["score"], "date": entry["date"]}
+            for entry in self.top()
+        }
+
+    # A page of the ranking as [{'username', 'score', 'date'}]
+    def top(self, count=None, offset=0):
+        with self.lock, locked(self.lock_path, exclusive=False):
+            self._refresh()
+            return [
+                {"username": username, "score": score, "date": self.scores[username]["date"]}
+                for username, score in self.ranking.top(count, offset)
+            ]
+
+    # 1-based rank of a user, or None
+    def rank(self, username):
+        with self.lock, locked(self.lock_path, exclusive=False):
+            self._refresh()
+            return self.ranking.rank(username)
+
+    # Add points to a user's score and return their new total
+    def add(self, username, score, date):
+        with self.lock, locked(self.lock_path, exclusive=True):
+            self._refresh()
+            entry = self.scores.get(username)
+            total = entry["score"] + score if entry else score
+            self._append({"username": username, "score": total, "date": date})
+            return total
+
+    # Remove a user's score, returns False if they had none
+    def remove(self, username):
+        with self.lock, locked(self.lock_path, exclusive=True):
+            self._refresh()
+            if username not in self.scores:
+                return False
+            self._append({"username": username, "score": None})
+            return True
+
+    # Remove every score, returns False if there were none
+    def clear(self):
+        with self.lock, locked(self.lock_path, exclusive=True):
+            self._refresh()
+            if not self.scores:
+                return False
+            self.scores = {}
+            self.ranking.clear()
+            self._compact()
+            return True
+
+    def _stat_id(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    # Catch up with changes made by other processes
+    def _refresh(self):
+        snapshot_id = self._stat_id()
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+        if snapshot_id != self.snapshot_id or journal_size < self.journal_offset:
+            self._load_snapshot(snapshot_id)
+        if journal_size > self.journal_offset:
+            self._replay()
+
+    def _load_snapshot(self, snapshot_id):
+        self.scores = {}
+        self.ranking.clear()
+        if snapshot_id is not None:
+            with open(self.path, "r") as file:
+                for username, data in json.load(file).items():
+                    self.scores[username] = data
+                    self.ranking.set(username, data["score"])
+        self.snapshot_id = snapshot_id
+        self.journal_offset = 0
+        self.journal_entries = 0
+
+    # Apply complete journal lines past our offset. A torn line left by a
+    # crash is ignored until a writer truncates it away
+    def _replay(self):
+        with open(self.journal_path, "rb") as file:
+            file.seek(self.journal_offset)
+            data = file.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+            self.journal_entries += 1
+        self.journal_offset += end
+
+    def _apply(self, entry):
+        username = entry["username"]
+        if entry["score"] is None:
+            self.scores.pop(username, None)
+            self.ranking.remove(username)
+        else:
+            self.scores[username] = {"score": entry["score"], "date": entry["date"]}
+            self.ranking.set(username, entry["score"])
+
+    # Journal entries hold absolute values, so replaying one twice (after a
+    # crash mid-compaction) is harmless
+    def _append(self, entry):
+        line = (json.dumps(entry) + "\n").encode()
+        with open(self.journal_path, "ab") as file:
+            file.truncate(self.journal_offset)
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self.journal_offset += len(line)
+        self.journal_entries += 1
+        self._apply(entry)
+        if self.journal_entries >= self.compact_threshold:
+            self._compact()
+
+    # Write a fresh snapshot in rank order and empty the journal
+    def _compact(self):
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        snapshot = {
+            username: self.scores[username] for username, _ in self.ranking.top()
+        }
+        with open(temp, "w") as file:
+            json.dump(snapshot, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+        with open(self.journal_path, "wb"):
+            pass
+        self.snapshot_id = self._stat_id()
+        self.journal_offset = 0
+        self.journal_entries = 0
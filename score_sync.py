@@ -0,0 +1,92 @@
+# Write-behind score submission for TuiTrivia
+
+import json
+import os
+import threading
+from hashlib import sha256
+
+# Seconds to collect score updates before they are sent to the API
+FLUSH_INTERVAL = 2
+
+
+class ScoreOutbox:
+    def __init__(self, path, submit, flush_interval=FLUSH_INTERVAL):
+        # submit(entry) sends one {'username', 'score', 'date'} entry and
+        # returns True once the entry is done with (accepted or rejected)
+        self.path = path
+        self.submit = submit
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    # Load submissions left over from an earlier session and start sending
+    # them in the background
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock:
+            for name in os.listdir(self.path):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.path, name), "r") as file:
+                        entry = json.load(file)
+                except (OSError, ValueError):
+                    continue
+                self.pending.setdefault(entry["username"], entry)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    # Queue a user's cumulative score. Later updates for the same user
+    # replace earlier ones, so a streak is sent as a single request
+    def put(self, username, score, date):
+        entry = {"username": username, "score": score, "date": date}
+        with self.lock:
+            self.pending[username] = entry
+            self._write(entry)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+    # Send every queued score now, returns the number still pending
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                entries = list(self.pending.values())
+            for entry in entries:
+                if not self.submit(entry):
+                    continue
+                with self.lock:
+                    # Keep the entry if a newer score arrived meanwhile
+                    if self.pending.get(entry["username"]) is entry:
+                        del self.pending[entry["username"]]
+                        self._remove(entry["username"])
+        return len(self)
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _file(self, username):
+        return os.path.join(self.path, sha256(username.encode()).hexdigest() + ".json")
+
+    # Each user has their own outbox file, replaced atomically
+    def _write(self, entry):
+        path = self._file(entry["username"])
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as file:
+            json.dump(entry, file)
+        os.replace(temp, path)
+
+    def _remove(self, username):
+        try:
+            os.remove(self._file(username))
+        except FileNotFoundError:
+            pass
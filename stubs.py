@@ -0,0 +1,74 @@
+# Local stand-ins for the Open Trivia Database and the leaderboard API,
+# used by the benchmark suite and for playing without network access. The
+# leaderboard is the real leaderboard server, run on localhost
+
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from json_http import JsonHandler, JsonServer
+from leaderboard_server import Leaderboard, LeaderboardHandler, LeaderboardServer
+
+
+# Waits before every response to simulate network latency
+class Delayed:
+    # Seconds added to every response
+    latency = 0
+
+    def send_json(self, status, data, headers=None):
+        if self.latency:
+            time.sleep(self.latency)
+        super().send_json(status, data, headers)
+
+
+class StubHandler(Delayed, JsonHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class OpenTDBStub(StubHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        match url.path:
+            case "/api.php":
+                amount = min(int(params.get("amount", 1)), 50)
+                results = [self.question(params) for _ in range(amount)]
+                self.send_json(200, {"response_code": 0, "results": results})
+            case "/api_token.php":
+                token = params.get("token") or f"{random.getrandbits(64):016x}"
+                self.send_json(200, {"response_code": 0, "token": token})
+            case _:
+                self.send_json(404, {})
+
+    def question(self, params):
+        a, b = random.randint(1, 10**6), random.randint(1, 10**6)
+        return {
+            "type": "multiple",
+            "difficulty": params.get("difficulty", "easy"),
+            "category": "Stub",
+            "question": f"What is {a} + {b}?",
+            "correct_answer": str(a + b),
+            "incorrect_answers": [str(a + b + n) for n in (1, 2, 3)],
+        }
+
+
+# Function to serve a stub on a free localhost port in a background thread.
+# Returns the server and its base URL
+def start_stub(handler, latency=0):
+    handler = type(handler.__name__, (handler,), {"latency": latency})
+    return serve(JsonServer(("127.0.0.1", 0), handler))
+
+
+# Function to serve an empty leaderboard, saved to path, on a free localhost
+# port in a background thread. Returns the server and its base URL
+def start_leaderboard(path, latency=0, api_key=None):
+    handler = type("LeaderboardHandler", (Delayed, LeaderboardHandler), {"latency": latency})
+    server = type("LeaderboardServer", (LeaderboardServer,), {"handler": handler})
+    return serve(server(("127.0.0.1", 0), Leaderboard(path), api_key))
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
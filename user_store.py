@@ -0,0 +1,112 @@
+# User accounts for TuiTrivia, backed by SQLite
+
+import json
+import os
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Milliseconds a writer waits for another process to finish its write
+BUSY_TIMEOUT = 5000
+# Database user_version once users.json has been imported
+MIGRATED_VERSION = 1
+
+
+# Accounts are looked up through the primary key index, so logging in reads
+# one row however many accounts there are. Registering inserts one row and
+# fails if the username is taken, which keeps concurrent registrations from
+# overwriting each other
+class UserStore:
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.db = None
+        self.lock = threading.Lock()
+
+    # The database is opened on first use so startup never touches the disk
+    def _connect(self):
+        if self.db is None:
+            import sqlite3
+
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # WAL lets logins read while another process registers
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+            db.executescript(SCHEMA)
+            self.db = db
+            self._migrate()
+        return self.db
+
+    # Password hash of a user, or None if they don't exist
+    def get(self, username):
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT password FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    # Add a new user, returns False if the username is already taken
+    def add(self, username, password):
+        with self.lock:
+            cursor = self._connect().execute(
+                "INSERT OR IGNORE INTO users VALUES (?, ?)", (username, password)
+            )
+        return cursor.rowcount == 1
+
+    # Add or update many users in one transaction
+    def update(self, users):
+        with self.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO users VALUES (?, ?)", users.items()
+                )
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    # Every user and their password hash
+    def all(self):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT username, password FROM users ORDER BY username"
+            ).fetchall()
+        return dict(rows)
+
+    def __len__(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    # Import accounts from the old users.json file, once. The file is left
+    # where it is, the database remembers that it was imported
+    def _migrate(self):
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        if self.db.execute("PRAGMA user_version").fetchone()[0] >= MIGRATED_VERSION:
+            return
+        try:
+            with open(self.legacy_path, "r") as file:
+                users = json.load(file)
+        except FileNotFoundError:
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have imported it in the meantime
+            if self.db.execute("PRAGMA user_version").fetchone()[0] < MIGRATED_VERSION:
+                # Accounts registered since the upgrade win over the old file
+                self.db.executemany("INSERT OR IGNORE INTO users VALUES (?, ?)", users.items())
+                self.db.execute(f"PRAGMA user_version = {MIGRATED_VERSION}")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")